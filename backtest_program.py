@@ -1,3 +1,4 @@
+import argparse
 import csv
 from pathlib import Path
 import sys
@@ -5,6 +6,8 @@ import os
 import shutil
 
 from program.models.Backtest import Backtest
+from program.models.Pruning import PruningRules
+from program.models.Sweep import get_indicator_cache_stats, get_pruned_jobs, run_sweeps
 from program.models.Strategies.Double_EMA_MACD_Cross import DoubleEmaMacdCross
 from program.models.Strategies.Double_EMA_MACD_Hist import DoubleEmaMacdHist
 from program.models.Strategies.Wavetrend_EMA import WavetrendEMA
@@ -91,16 +94,22 @@ def sort_results_in_directories():
                 shutil.copyfile(origin_file_path, copy_path)
 
 if __name__ == '__main__':
-    for tf in tfs:
-        for pair in pairs:
-            for rr in rrs:
-                for atr in atrs:
-                    try:
-                        strategy = SupertrendEmaTrailing(pair, tf, rr=float(rr), atr_multiplier=float(atr))  # rr and atr_multiplier
-                        backtest = Backtest(strategy, 1000, 2, commission=0.06)
-                        backtest.run()
-                    except Exception as e:
-                        print('Error Backtesting {} on Timeframe {} with Risk/Reward {} and Atr Multiplier of {}!\n{}'.format(pair, tf, rr, atr, e))
+    parser = argparse.ArgumentParser(description='Backtest a strategy over every pair, timeframe, risk/reward and atr multiplier.')
+    parser.add_argument('--jobs', type=int, default=1, help='number of worker processes, 0 uses every core')
+    parser.add_argument('--max-drawdown', type=float, default=None, help='stop a backtest once its drawdown exceeds this percentage')
+    parser.add_argument('--min-balance', type=float, default=None, help='stop a backtest once its balance drops below this amount')
+    parser.add_argument('--min-trades', type=int, default=None, help='stop a backtest once its trade rate can\'t reach this number of trades')
+    parser.add_argument('--batch', action='store_true', help='simulate the whole rr and atr grid of a pair and timeframe in one pass')
+    args = parser.parse_args()
+
+    pruning = None
+    if args.max_drawdown is not None or args.min_balance is not None or args.min_trades:
+        pruning = PruningRules(max_drawdown=args.max_drawdown, min_balance=args.min_balance, min_trades=args.min_trades)
+
+    # indicators are computed once per pair and timeframe and shared by every rr and atr_multiplier
+    results = run_sweeps(SupertrendEmaTrailing, pairs, tfs, rrs, atrs, 1000, 2, commission=0.06, processes=args.jobs, pruning=pruning, batch=args.batch)
+    print('Indicator cache: {hits} hits, {misses} misses, {evictions} evictions'.format(**get_indicator_cache_stats(results)))
+    print('Pruned {} of {} backtests'.format(len(get_pruned_jobs(results)), len(results)))
 
     # strategy = SupertrendEmaTrailing('BTCUSDT', '1h', rr=float(3.5), atr_multiplier=float(2.9))  # rr and atr_multiplier
     # backtest = Backtest(strategy, 1000, 2, commission=0.06)
@@ -0,0 +1,70 @@
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from program.models import Kernels
+from program.models.Simulator import simulate_fixed_exits, simulate_trailing_exits
+from program.models.Strategies.Supertrend_Ema_Trailing import SupertrendEmaTrailing
+
+
+def time_kernel(kernel, use_numba, repeat=5):
+    # Best of repeat runs, the first compiled run is excluded so Numba's compile time doesn't count
+    os.environ['USE_NUMBA'] = '1' if use_numba else '0'
+    result = kernel()
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        kernel()
+        timings.append(time.perf_counter() - start)
+
+    return min(timings), result
+
+
+def same_result(python_result, jit_result):
+    if isinstance(python_result, tuple):
+        return all(same_result(python_values, jit_values) for python_values, jit_values in zip(python_result, jit_result))
+
+    return np.array_equal(python_result, jit_result, equal_nan=python_result.dtype.kind == 'f')
+
+
+if __name__ == '__main__':
+    pair = sys.argv[1] if len(sys.argv) > 1 else 'BTCUSDT'
+    tf = sys.argv[2] if len(sys.argv) > 2 else '4h'
+
+    if not Kernels.njit:
+        print('Numba is not installed, only the Python kernels are available.')
+        sys.exit(1)
+
+    strategy = SupertrendEmaTrailing(pair, tf, rr=2.0, atr_multiplier=1.5)
+    strategy.load_indicators(signals=True)
+    strategy.set_stops()
+    df = strategy.df
+
+    close = df['Close'].to_numpy()
+    upperband = (df['Close'] + df['Raw ATR'] * 3).to_numpy()
+    lowerband = (df['Close'] - df['Raw ATR'] * 3).to_numpy()
+    columns = [df[column].to_numpy() for column in ['Enter', 'Side', 'SL Price', 'TP Price', 'High', 'Low']]
+
+    # name, kernel call
+    benchmarks = [
+        ('Supertrend', lambda: (Kernels.supertrend(close, upperband.copy(), lowerband.copy()),)),
+        ('Fixed exits', lambda: simulate_fixed_exits(*columns)),
+        ('Trailing exits', lambda: simulate_trailing_exits(*columns, df['ATR'].to_numpy()))
+    ]
+
+    print('Kernels on {} {} ({} candles)'.format(pair, tf, len(df)))
+    for name, kernel in benchmarks:
+        python_time, python_result = time_kernel(kernel, use_numba=False)
+        jit_time, jit_result = time_kernel(kernel, use_numba=True)
+
+        print('    {}'.format(name))
+        print('        Python:      {:.4f}s'.format(python_time))
+        print('        Numba:       {:.4f}s'.format(jit_time))
+        print('        Speedup:     {:.1f}x'.format(python_time / jit_time))
+        print('        Same result: {}'.format(same_result(python_result, jit_result)))
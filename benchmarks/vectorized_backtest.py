@@ -0,0 +1,50 @@
+import contextlib
+import io
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from program.models.Backtest import Backtest
+from program.models.Strategies.Double_EMA_MACD_Cross import DoubleEmaMacdCross
+from program.models.Strategies.Supertrend_Ema_Trailing import SupertrendEmaTrailing
+from program.models.Strategies.Vumanchu_EMAs_MFI import VumanchuEmasMfi
+from program.models.Strategies.Wavetrend_EMA import WavetrendEMA
+
+
+def time_backtest(strategy_class, pair, tf, **run_options):
+    strategy = strategy_class(pair, tf, rr=2.0, atr_multiplier=1.5)
+    backtest = Backtest(strategy, 1000, 2, commission=0.06)
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        backtest.run(test=True, **run_options)
+
+    return time.perf_counter() - start, backtest
+
+
+if __name__ == '__main__':
+    pair = sys.argv[1] if len(sys.argv) > 1 else 'BTCUSDT'
+    tf = sys.argv[2] if len(sys.argv) > 2 else '4h'
+
+    # strategy, name of the fast path, run options of the fast path
+    benchmarks = [
+        (DoubleEmaMacdCross, 'Vectorized', {'vectorized': True}),
+        (WavetrendEMA, 'Vectorized', {'vectorized': True}),
+        (VumanchuEmasMfi, 'Vectorized', {'vectorized': True}),
+        (SupertrendEmaTrailing, 'Array loop', {'vectorized': False, 'array_backed': True}),
+        (SupertrendEmaTrailing, 'Vectorized', {'vectorized': True})
+    ]
+
+    for strategy_class, fast_name, fast_options in benchmarks:
+        loop_time, loop_backtest = time_backtest(strategy_class, pair, tf, vectorized=False, array_backed=False)
+        fast_time, fast_backtest = time_backtest(strategy_class, pair, tf, **fast_options)
+
+        same_trades = loop_backtest.trades == fast_backtest.trades and loop_backtest.balance == fast_backtest.balance
+
+        print('{} on {} {} ({} candles, {} trades)'.format(strategy_class.__name__, pair, tf, len(fast_backtest.strategy.df), len(fast_backtest.trades)))
+        print('    Row loop:      {:.3f}s'.format(loop_time))
+        print('    {:<15}{:.3f}s'.format(fast_name + ':', fast_time))
+        print('    Speedup:       {:.1f}x'.format(loop_time / fast_time))
+        print('    Same trades:   {}'.format(same_trades))
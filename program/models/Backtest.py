@@ -1,4 +1,5 @@
 import csv
+import time
 import warnings
 from pathlib import Path
 
@@ -6,14 +7,20 @@ import numpy as np
 import pandas as pd
 import plotly.express as px
 from dateutil import relativedelta
+from program.models.BarState import BarState
+from program.models.Metrics import trade_metrics
+from program.models.Pruning import PruningRules
+from program.models.Replay import replay_trades
+from program.models.Simulator import continue_position, find_exit, find_trailing_exit, simulate_fixed_exits, simulate_trailing_exits
 from program.models.Strategies import Strategy
+from program.models.TradeLedger import TradeLedger
 
 warnings.filterwarnings('ignore')
 data_path = Path(__file__).parent.parent.parent / 'Data/'
 
 
 class Backtest:
-    def __init__(self, strategy: Strategy, starting_balance: float, risk: int, commission=0):
+    def __init__(self, strategy: Strategy, starting_balance: float, risk: int, commission=0, pruning: PruningRules = None):
         super(Backtest, self).__init__()
 
         # TODO: Fees is contract size / price * 0.06%
@@ -25,38 +32,42 @@ class Backtest:
         self.has_open_position = False
         self.start_date = None
         self.end_date = None
-        self.trades = []
+        self.trades = TradeLedger()
+        # position still open when the data ended, its fee is paid but it isn't part of the trades
+        self.open_trade = None
         self.fees = 0
         self.commission = commission / 100
         self.results = {}
-
-    def run(self, test=False):
+        self.timings = {}
+        self.underwater = None
+        # equity curve of a streaming run, the other runs keep the equity of every candle in the Equity column
+        self.equity = None
+
+        self.pruning = pruning
+        self.pruned = None
+        self.peak_balance = starting_balance
+
+    def run(self, test=False, vectorized=None, array_backed=None, simulation=None, chunk_size=None):
+        # simulation holds the entries, exits and exit prices of a prepared vectorized run when they were simulated in a batch.
+        # With chunk_size the candles are streamed from the csv chunk_size rows at a time.
         self.print_header()
-        # set dataframe values
-        self.strategy.set_indicators()
-        self.strategy.set_columns()
-
-        # make sure indexes pair with number of rows
-        self.strategy.df = self.strategy.df.reset_index()
 
-        self.strategy.df = self.strategy.df[:-1]
-
-        self.start_date = self.strategy.df['Open Time'].iloc[0]
-        self.end_date = self.strategy.df['Close Time'].iloc[-1]
+        if simulation is not None:
+            self._apply_trades(*simulation)
+        elif chunk_size:
+            self._run_streaming(chunk_size)
+        elif self.strategy.vectorized if vectorized is None else vectorized:
+            self._run_vectorized()
+        elif self.strategy.array_backed if array_backed is None else array_backed:
+            self._run_bars()
+        else:
+            self._run_loop()
 
-        for index, row in self.strategy.df.iterrows():
-            self.strategy.set_basic_columns(index, row)
-            self.strategy.add_equity(index, row, self.balance)
-            if not self.has_open_position:
-                self.strategy.set_entry_signals(index, row)
-                if row['Enter'] == 1:
-                    self.open_position(row)
-            else:
-                self.strategy.set_exit_signals(self.trades[-1], index, row)
-                if row['Exit'] == 1:
-                    self.close_position(row)
-                elif index == self.strategy.df.iloc[-1].name:
-                    self.trades.pop()
+        if self.pruned:
+            print('\n')
+            print('Pruned: {}!'.format(self.pruned))
+            print('\n')
+            return
 
         if self.balance <= self.starting_balance:
             print('\n')
@@ -74,7 +85,7 @@ class Backtest:
             print('\n')
             return
 
-        self._calculate_results()
+        self._calculate_results(self.equity)
         if self.results['gmean_monthly_return'] >= 3.0:
             self.print_results() if test else self.print_results_to_file()
         else:
@@ -82,6 +93,360 @@ class Backtest:
             print('Monthly percentage of 3% not reached!')
             print('\n')
 
+    def replay(self, risks, commissions):
+        # The trades of this run with other risk percentages and commissions, without simulating the candles again
+        return replay_trades(self, risks, commissions)
+
+    def _run_loop(self):
+        # set dataframe values
+        self.strategy.load_indicators()
+        self.strategy.set_columns()
+
+        # make sure indexes pair with number of rows
+        self.strategy.df = self.strategy.df.reset_index()
+        self.strategy.set_levels()
+
+        self.start_date = self.strategy.df['Open Time'].iloc[0]
+        self.end_date = self.strategy.df['Close Time'].iloc[-1]
+
+        # the candles between an entry and its exit only carry the position (and trail its stop), they are skipped
+        trails = self._get_trails(self.strategy.df)
+        resume_index = 0
+
+        for index, row in self.strategy.df.iterrows():
+            if index < resume_index:
+                continue
+
+            self.strategy.set_basic_columns(index, row)
+            self.strategy.add_equity(index, row, self.balance)
+            if not self.has_open_position:
+                self.strategy.set_entry_signals(index, row)
+                if row['Enter'] == 1:
+                    self.open_position(row)
+                    resume_index = self._carry_to_exit(index, trails)
+            else:
+                self.strategy.set_exit_signals(self.trades[-1], index, row)
+                if row['Exit'] == 1:
+                    self.close_position(row)
+                    if self.pruning and self._is_pruned(index, len(self.strategy.df)):
+                        break
+                elif index == self.strategy.df.iloc[-1].name:
+                    self.open_trade = self.trades.pop()
+
+    def _run_bars(self):
+        # set dataframe values
+        self.strategy.load_indicators()
+        self.strategy.set_columns()
+
+        self.strategy.df = self.strategy.df.reset_index(drop=True)
+        self.strategy.set_levels()
+
+        self.start_date = self.strategy.df['Open Time'].iloc[0]
+        self.end_date = self.strategy.df['Close Time'].iloc[-1]
+
+        state = BarState(self.strategy.df)
+        open_times = self.strategy.df['Open Time']
+        close_times = self.strategy.df['Close Time']
+        last_index = state.length - 1
+        trails = self._get_trails(self.strategy.df)
+        resume_index = 0
+
+        for index in range(state.length):
+            if index < resume_index:
+                continue
+
+            state.carry(index)
+            state.equity[index] = self.balance
+            state.in_position = self.has_open_position
+
+            self.strategy.on_bar(index, state)
+
+            if not self.has_open_position:
+                if state.enter[index] == 1:
+                    self.open_position({
+                        'Open Time': open_times.iloc[index],
+                        'Side': state.side[index],
+                        'Entry Price': float(state.entry_price[index]),
+                        'TP Price': float(state.tp_price[index]),
+                        'SL Price': float(state.sl_price[index])
+                    })
+                    state.position_side = 1 if state.side[index] == 1 else -1
+                    resume_index = self._carry_bars_to_exit(index, state, trails)
+            else:
+                if state.exit[index] == 1:
+                    self.close_position({
+                        'Exit Price': float(state.exit_price[index]),
+                        'Close': float(state.close[index]),
+                        'Close Time': close_times.iloc[index]
+                    })
+                    state.position_side = 0
+                    if self.pruning and self._is_pruned(index, state.length):
+                        break
+                elif index == last_index:
+                    self.open_trade = self.trades.pop()
+
+        self.strategy.df = state.write_back()
+
+    def _get_trails(self, df):
+        # Where a trailing stop moves to after every candle, for longs and shorts. None for fixed stops.
+        if not self.strategy.trailing_stop:
+            return None
+
+        distance = df[self.strategy.trailing_stop].to_numpy(dtype=float)
+        return df['Low'].to_numpy(dtype=float) - distance, df['High'].to_numpy(dtype=float) + distance
+
+    def _find_exit(self, entry, high, low, trails):
+        # Exit candle of the position opened on entry (the last candle when it's still open at the end)
+        # and, for a trailing stop, the stop of every candle after the entry up to that one
+        trade = self.trades.records[-1]
+        is_long = trade['side'] == TradeLedger.LONG
+
+        if trails is None:
+            exit_index, stops = find_exit(high, low, entry + 1, trade['take_profit'], trade['stop_loss'], is_long), None
+        else:
+            trail = trails[0] if is_long else trails[1]
+            exit_index, stops = find_trailing_exit(high, low, entry + 1, trade['take_profit'], trade['stop_loss'], trail, is_long)
+
+        return len(high) - 1 if exit_index == -1 else exit_index, stops
+
+    def _carry_to_exit(self, entry, trails):
+        # Fills the candles between entry and exit the way set_basic_columns, add_equity and the exit hooks would,
+        # the loop continues at the exit candle. A trailing stop is written as the stop the next candle checks.
+        df = self.strategy.df
+        exit_index, stops = self._find_exit(entry, df['High'].to_numpy(dtype=float), df['Low'].to_numpy(dtype=float), trails)
+
+        if exit_index > entry + 1:
+            columns = df.columns.get_indexer(['Has Open Position', 'SL Price', 'TP Price', 'Equity'])
+            df.iloc[entry + 1:exit_index, columns] = [1, df['SL Price'].iat[entry], df['TP Price'].iat[entry], self.balance]
+            if stops is not None:
+                df.iloc[entry + 1:exit_index, columns[1]] = stops[1:exit_index - entry]
+
+        return exit_index
+
+    def _carry_bars_to_exit(self, entry, state, trails):
+        # Array version of _carry_to_exit
+        exit_index, stops = self._find_exit(entry, state.high, state.low, trails)
+
+        state.has_open_position[entry + 1:exit_index] = 1
+        state.sl_price[entry + 1:exit_index] = state.sl_price[entry] if stops is None else stops[1:exit_index - entry]
+        state.tp_price[entry + 1:exit_index] = state.tp_price[entry]
+        state.equity[entry + 1:exit_index] = self.balance
+
+        return exit_index
+
+    def _run_vectorized(self):
+        self.prepare_vectorized()
+        df = self.strategy.df
+
+        columns = [df[column].to_numpy() for column in ['Enter', 'Side', 'SL Price', 'TP Price', 'High', 'Low']]
+        if self.strategy.trailing_stop:
+            entries, exits, exit_prices = simulate_trailing_exits(*columns, df[self.strategy.trailing_stop].to_numpy())
+        else:
+            entries, exits, exit_prices = simulate_fixed_exits(*columns)
+        self._apply_trades(entries, exits, exit_prices)
+
+    def prepare_vectorized(self):
+        # set dataframe values, the strategy computes all signals up front
+        self.strategy.load_indicators(signals=True)
+        self.strategy.set_levels()
+        self.strategy.set_stops()
+
+        self.strategy.df = self.strategy.df.reset_index(drop=True)
+
+        self.start_date = self.strategy.df['Open Time'].iloc[0]
+        self.end_date = self.strategy.df['Close Time'].iloc[-1]
+
+    def _apply_trades(self, entries, exits, exit_prices):
+        # Book the simulated trades in order and rebuild the bookkeeping columns of the row based loop
+        df = self.strategy.df
+        equity = np.empty(len(df))
+        has_open_position = np.zeros(len(df), dtype=int)
+        exit_column = np.zeros(len(df), dtype=int)
+        exit_price_column = np.zeros(len(df))
+
+        start = 0
+        for entry, exit_index, exit_price in zip(entries.tolist(), exits.tolist(), exit_prices.tolist()):
+            equity[start:entry + 1] = self.balance
+            self.open_position({
+                'Open Time': df['Open Time'].iloc[entry],
+                'Side': df['Side'].iloc[entry],
+                'Entry Price': float(df['Close'].iloc[entry]),
+                'TP Price': float(df['TP Price'].iloc[entry]),
+                'SL Price': float(df['SL Price'].iloc[entry])
+            })
+
+            if exit_index == -1:
+                # position still open at the end of the data
+                equity[entry + 1:] = self.balance
+                has_open_position[entry + 1:] = 1
+                self.open_trade = self.trades.pop()
+                start = len(df)
+                break
+
+            equity[entry + 1:exit_index + 1] = self.balance
+            has_open_position[entry + 1:exit_index] = 1
+            exit_column[exit_index] = 1
+            exit_price_column[exit_index] = exit_price
+            self.close_position({
+                'Exit Price': exit_price,
+                'Close': float(df['Close'].iloc[exit_index]),
+                'Close Time': df['Close Time'].iloc[exit_index]
+            })
+            start = exit_index + 1
+
+            if self.pruning and self._is_pruned(exit_index, len(df)):
+                break
+
+        equity[start:] = self.balance
+
+        entry_column = np.zeros(len(df), dtype=int)
+        entry_column[entries] = 1
+        entry_price_column = np.where(entry_column, df['Close'], 0.0)
+
+        df['Enter'] = entry_column
+        df['Entry Price'] = entry_price_column
+        df['Has Open Position'] = has_open_position
+        df['Exit'] = exit_column
+        df['Exit Price'] = exit_price_column
+        df['Equity'] = equity
+
+    def _run_streaming(self, chunk_size):
+        # Indicators and signals of a chunk are computed over the chunk and the warmup_candles candles before it, a position
+        # still open at the end of a chunk is carried into the next one. Memory depends on the chunk size, not on the
+        # length of the data. Pruning needs the number of candles up front, streaming runs don't check it.
+        # Every chunk is a frame of its own, its indicators are computed directly instead of going through the cache.
+        strategy = self.strategy
+        if not strategy.vectorized:
+            raise Exception('Streaming needs a vectorized strategy')
+
+        cache_indicators, strategy.cache_indicators = strategy.cache_indicators, False
+        try:
+            position, equity_parts = self._stream_chunks(chunk_size)
+        finally:
+            strategy.cache_indicators = cache_indicators
+
+        if position is not None:
+            # position still open at the end of the data
+            self.open_trade = self.trades.pop()
+
+        if equity_parts:
+            self.equity = pd.concat(equity_parts)
+
+    def _stream_chunks(self, chunk_size):
+        # Books the trades of every chunk, returns the position still open at the end and the equity of every chunk
+        strategy = self.strategy
+        warmup = None
+        position = None
+        equity_parts = []
+        for chunk in strategy.iter_candle_chunks(chunk_size):
+            candles = chunk if warmup is None else pd.concat([warmup, chunk], ignore_index=True)
+            warmup = candles.iloc[-strategy.warmup_candles:]
+
+            strategy.df = candles.copy()
+            strategy.indicators_set = False
+            strategy.load_indicators(signals=True)
+            strategy.set_levels()
+            strategy.set_stops()
+
+            # only the candles of the chunk are simulated, the warm up candles were simulated with the previous one
+            df = strategy.df.reset_index(drop=True)
+            df = df.iloc[np.searchsorted(df['Open Time'].to_numpy(), chunk['Open Time'].to_numpy()[0]):].reset_index(drop=True)
+            if not len(df):
+                continue
+
+            if self.start_date is None:
+                self.start_date = df['Open Time'].iloc[0]
+            self.end_date = df['Close Time'].iloc[-1]
+
+            position, equity, events = self._stream_trades(df, position)
+            equity_parts.append(self._compress_equity(df['Open Time'], equity, events))
+
+        return position, equity_parts
+
+    def _stream_trades(self, df, position):
+        # Books the trades of one chunk, position is the one carried over from the previous chunk (None when flat).
+        # Returns the position still open at the end of the chunk, the equity at the start of every candle and the candles
+        # trades were entered and exited on.
+        high = df['High'].to_numpy(dtype=float)
+        low = df['Low'].to_numpy(dtype=float)
+        side = df['Side'].to_numpy()
+        sl = df['SL Price'].to_numpy(dtype=float)
+        tp = df['TP Price'].to_numpy(dtype=float)
+        enter = df['Enter'].to_numpy() == 1
+        distance = df[self.strategy.trailing_stop].to_numpy(dtype=float) if self.strategy.trailing_stop else None
+        trails = None if distance is None else {True: low - distance, False: high + distance}
+
+        equity = np.empty(len(df))
+        events = []
+        start = 0
+        if position is not None:
+            trail = None if trails is None else trails[position['is_long']]
+            exit_index, price, stop = continue_position(high, low, position['take_profit'], position['stop_loss'], position['is_long'], trail)
+            if exit_index == -1:
+                equity[:] = self.balance
+                position['stop_loss'] = stop
+                return position, equity, events
+
+            events.append(exit_index)
+            equity[:exit_index + 1] = self.balance
+            self.close_position({'Exit Price': price, 'Close': float(df['Close'].iloc[exit_index]), 'Close Time': df['Close Time'].iloc[exit_index]})
+            start = exit_index + 1
+            enter[:start] = False
+
+        if distance is None:
+            entries, exits, exit_prices = simulate_fixed_exits(enter, side, sl, tp, high, low)
+        else:
+            entries, exits, exit_prices = simulate_trailing_exits(enter, side, sl, tp, high, low, distance)
+
+        position = None
+        for entry, exit_index, exit_price in zip(entries.tolist(), exits.tolist(), exit_prices.tolist()):
+            events.append(entry)
+            equity[start:entry + 1] = self.balance
+            self.open_position({
+                'Open Time': df['Open Time'].iloc[entry],
+                'Side': side[entry],
+                'Entry Price': float(df['Close'].iloc[entry]),
+                'TP Price': float(tp[entry]),
+                'SL Price': float(sl[entry])
+            })
+
+            if exit_index == -1:
+                # carried into the next chunk with the stop loss it has on the candle after this one
+                is_long = bool(side[entry] == 1)
+                trail = None if trails is None else trails[is_long][entry + 1:]
+                _, _, stop = continue_position(high[entry + 1:], low[entry + 1:], tp[entry], sl[entry], is_long, trail)
+                position = {'is_long': is_long, 'take_profit': tp[entry], 'stop_loss': stop}
+                start = entry + 1
+                break
+
+            events.append(exit_index)
+            equity[entry + 1:exit_index + 1] = self.balance
+            self.close_position({'Exit Price': exit_price, 'Close': float(df['Close'].iloc[exit_index]), 'Close Time': df['Close Time'].iloc[exit_index]})
+            start = exit_index + 1
+
+        equity[start:] = self.balance
+
+        return position, equity, events
+
+    def _compress_equity(self, open_times, equity, events=()):
+        # Equity of the candles on both sides of every change, of the last candle of every day and of the first and last
+        # candle. Drawdowns and daily returns come out the same as from the equity of every candle.
+        # The entry and exit candles in events and the candles after them are always kept, they are where replay
+        # changes the balance, also for a trade that didn't change it in this run (no commission, break even).
+        times = open_times.to_numpy(dtype='datetime64[ns]')
+        changes = np.flatnonzero(equity[1:] != equity[:-1])
+        day_ends = np.flatnonzero(times[1:].astype('datetime64[D]') != times[:-1].astype('datetime64[D]'))
+        events = np.asarray(events, dtype=np.int64)
+        keep = np.unique(np.r_[0, changes, changes + 1, events, np.minimum(events + 1, len(equity) - 1), day_ends, len(equity) - 1])
+
+        return pd.Series(equity[keep], index=pd.DatetimeIndex(times[keep], name='Open Time'))
+
+    def _is_pruned(self, index, length):
+        # Checked after every closed trade on every path, so a pruned run stops flat and at the same trade whichever
+        # engine ran it. Entry fees alone never prune a run.
+        self.pruned = self.pruning.check(self.balance, self.peak_balance, len(self.trades), index, length)
+        return self.pruned is not None
+
     def print_header(self):
         print('\n')
         print('    _         _        ____             _    _            _   ')
@@ -110,63 +475,33 @@ class Backtest:
         self.fees += trading_fee
         self.balance -= trading_fee
 
-        self.trades.append({
-            'Open Time': row['Open Time'],
-            'Side': 'Long' if row['Side'] == 1 else 'Short',
-            'Price': row['Entry Price'],
-            'Take Profit': row['TP Price'],
-            'Stop Loss': row['SL Price'],
-            'Size': quantity
-        })
+        side = TradeLedger.LONG if row['Side'] == 1 else TradeLedger.SHORT
+        self.trades.open(row['Open Time'], side, row['Entry Price'], row['TP Price'], row['SL Price'], quantity)
 
     def close_position(self, row):
         self.has_open_position = False
-        latest_position = self.trades[-1]
+        latest_position = self.trades.records[-1]
         close_price = row['Exit Price'] or row['Close']
-
-        if latest_position['Side'] == 'Long':
-            return_perc = (close_price - latest_position['Price']) / latest_position['Price']
-            if close_price > latest_position['Price']:
-                return_amount = return_perc * latest_position['Size']
-                latest_position['Return'] = return_amount
-                latest_position['Return Perc'] = return_perc
-                latest_position['Outcome'] = '+'
-                self.balance += return_amount
-            elif close_price < latest_position['Price']:
-                return_amount = return_perc * latest_position['Size']
-                latest_position['Return'] = return_amount
-                latest_position['Return Perc'] = return_perc
-                latest_position['Outcome'] = '-'
-                self.balance += return_amount
-            else:
-                latest_position['Outcome'] = '0'
-                latest_position['Return Perc'] = 0
-                latest_position['Return'] = 0
-        elif latest_position['Side'] == 'Short':
-            return_perc = (latest_position['Price'] - close_price) / latest_position['Price']
-            if close_price > latest_position['Price']:
-                return_amount = return_perc * latest_position['Size']
-                latest_position['Return'] = return_amount
-                latest_position['Return Perc'] = return_perc
-                latest_position['Outcome'] = '-'
-                self.balance += return_amount
-            elif close_price < latest_position['Price']:
-                return_amount = return_perc * latest_position['Size']
-                latest_position['Return'] = return_amount
-                latest_position['Return Perc'] = return_perc
-                latest_position['Outcome'] = '+'
-                self.balance += return_amount
-            else:
-                latest_position['Outcome'] = '0'
-                latest_position['Return Perc'] = 0
-                latest_position['Return'] = 0
+        price = latest_position['price']
+
+        if latest_position['side'] == TradeLedger.LONG:
+            return_perc = (close_price - price) / price
+            outcome = TradeLedger.WIN if close_price > price else TradeLedger.LOSS if close_price < price else TradeLedger.BREAK_EVEN
+        elif latest_position['side'] == TradeLedger.SHORT:
+            return_perc = (price - close_price) / price
+            outcome = TradeLedger.LOSS if close_price > price else TradeLedger.WIN if close_price < price else TradeLedger.BREAK_EVEN
         else:
             raise Exception('No position side was defined')
 
-        latest_position['Close Price'] = close_price
-        latest_position['Close Time'] = row['Close Time']
-        latest_position['Balance'] = self.balance
-        self.trades[-1] = latest_position
+        if outcome == TradeLedger.BREAK_EVEN:
+            return_perc = 0
+            return_amount = 0
+        else:
+            return_amount = return_perc * latest_position['size']
+            self.balance += return_amount
+            self.peak_balance = max(self.peak_balance, self.balance)
+
+        self.trades.close(row['Close Time'], close_price, return_amount, return_perc, outcome, self.balance)
 
     def print_results_to_file(self):
         self.print_header_to_file()
@@ -333,27 +668,6 @@ class Backtest:
         except IOError:
             print("I/O error")
 
-    def _create_dataframe_from_list(self, trade_list):
-        time_array = [trade['Open Time'] for trade in trade_list]
-        balance_array = [trade['Balance'] for trade in trade_list]
-        returns_array = [trade['Return'] for trade in trade_list]
-        returns_perc_array = [trade['Return Perc'] for trade in trade_list]
-        close_time_array = [trade['Close Time'] for trade in trade_list]
-        outcome_array = [trade['Outcome'] for trade in trade_list]
-
-        df = pd.DataFrame.from_dict({'Time': time_array, 'Equity': balance_array, 'Returns': returns_array, 'Return Perc': returns_perc_array, 'Close Time': close_time_array, 'Outcome': outcome_array})
-
-        df['Duration'] = df['Close Time'] - df['Time']
-
-        df['Time'] = pd.to_datetime(df['Time'], format='%Y-%m-%d')
-        df['Equity'] = df['Equity'].astype(float)
-        df['Returns'] = df['Returns'].astype(float)
-        df['Return Perc'] = df['Return Perc'].astype(float)
-        df['Close Time'] = pd.to_datetime(df['Close Time'], format='%Y-%m-%d')
-        df['Outcome'] = df['Outcome'].astype(str)
-
-        return df
-
     def _get_trade_size(self, row):
         loss_perc = abs(row['Entry Price'] - row['SL Price']) / row['Entry Price']
         risk_amount = self.balance * (self.risk / 100)
@@ -363,7 +677,9 @@ class Backtest:
         fig = px.line(equity_df, x="Time", y="Equity", title=f"{self.strategy.symbol} on {self.strategy.tf} using {self.strategy.name}.")
         fig.write_image(data_path / f'Equity_Curves/{self.strategy.symbol}_{self.strategy.tf}_{self.strategy.short_name}_{self.strategy.risk_reward}RR_{self.strategy.atr_multiplier}ATR.pdf')
 
-    def _calculate_results(self):
+    def _calculate_results(self, equity=None):
+        start = time.perf_counter()
+
         self.results['abs_return'] = self.balance - self.starting_balance
         self.results['pc_return'] = 100 * self.results['abs_return'] / self.starting_balance
         self.results['amount_of_trades'] = len(self.trades)
@@ -371,14 +687,17 @@ class Backtest:
         date_diff = relativedelta.relativedelta(self.end_date, self.start_date)
         months_diff = (date_diff.years * 12) + date_diff.months
 
-        indexed_df = self.strategy.df.set_index('Open Time')
+        if equity is None:
+            equity = self.strategy.df.set_index('Open Time')['Equity']
 
-        self.results['equity_peak'] = indexed_df['Equity'].max()
+        self.results['equity_peak'] = equity.max()
 
-        dd, dd_duration, dd_peaks = self._get_dd_metrics(indexed_df['Equity'])
+        dd, dd_duration, dd_peaks = self._get_dd_metrics(equity)
         max_dd = -np.nan_to_num(dd.max())
+        # underwater curve, the fraction of equity below its peak as a negative number for every candle
+        self.underwater = 0 - dd.fillna(0)
 
-        day_returns = indexed_df['Equity'].resample('D').last().dropna().pct_change()
+        day_returns = equity.resample('D').last().dropna().pct_change()
         gmean_day_return = self.geometric_mean(day_returns)
 
         annualized_return = (1 + gmean_day_return) ** 365 - 1
@@ -406,79 +725,15 @@ class Backtest:
         # - SQN??
         ###
 
-        if self.results['gmean_monthly_return'] >= 3.0:
-            self.results['winning_trades'] = [trade for trade in self.trades if trade['Outcome'] == '+']
-            self.results['losing_trades'] = [trade for trade in self.trades if trade['Outcome'] == '-']
-            self.results['break_even_trades'] = [trade for trade in self.trades if trade['Outcome'] == '0']
-
-            self.results['long_trades'] = [trade for trade in self.trades if trade['Side'] == 'Long']
-            self.results['short_trades'] = [trade for trade in self.trades if trade['Side'] == 'Short']
-
-            self.results['pc_win'] = len(self.results['winning_trades']) / self.results['amount_of_trades']
-            self.results['pc_loss'] = len(self.results['losing_trades']) / self.results['amount_of_trades']
-            self.results['pc_breakeven'] = 100 * len(self.results['break_even_trades']) / self.results['amount_of_trades']
-
-            trades_df = self._create_dataframe_from_list(self.trades)
-            wins_df = self._create_dataframe_from_list(self.results['winning_trades'])
-            loss_df = self._create_dataframe_from_list(self.results['losing_trades'])
-            long_df = self._create_dataframe_from_list(self.results['long_trades'])
-            short_df = self._create_dataframe_from_list(self.results['short_trades'])
-
-            # self._write_equity_dataframe_to_file(trades_df)
-
-            self.results['max_win'] = wins_df['Returns'].max()
-            self.results['avg_win'] = wins_df['Returns'].mean()
-            self.results['max_loss'] = loss_df['Returns'].min()
-            self.results['avg_loss'] = loss_df['Returns'].mean()
+        self.timings['equity_metrics'] = time.perf_counter() - start
 
-            grouper = (trades_df.Outcome != trades_df.Outcome.shift()).cumsum()
-            self.results['longest_win_streak'] = trades_df.groupby(grouper).cumcount().max()
+        # every statistic is computed for every run, the 3% gate only decides what gets printed
+        metrics, trade_timings = trade_metrics(self.trades)
+        self.results.update(metrics)
+        self.timings.update({f'trade_metrics_{name}': value for name, value in trade_timings.items()})
 
-            gmean_trade_return = self.geometric_mean(trades_df['Return Perc'])
-
-            self.results['avg_trade_perc'] = gmean_trade_return * 100
-            self.results['max_trade_duration'] = self._round_timedelta(trades_df['Duration'].max())
-            self.results['avg_trade_duration'] = self._round_timedelta(trades_df['Duration'].mean())
-
-            self.results['profit_factor'] = wins_df['Returns'].sum() / abs(loss_df['Returns'].sum())
-            self.results['expectancy_perc'] = self._get_expectancy_ratio()
-            # self.results['sqn'] = np.sqrt(self.results['amount_of_trades']) * pl.mean() / (pl.std() or np.nan)
-
-            if len(self.results['long_trades']) > 0:
-                losing_long_trades = [trade for trade in self.results['long_trades'] if trade['Outcome'] == '-']
-                winning_long_trades = [trade for trade in self.results['long_trades'] if trade['Outcome'] == '+']
-
-                long_win_df = self._create_dataframe_from_list(winning_long_trades)
-                long_loss_df = self._create_dataframe_from_list(losing_long_trades)
-
-                self.results['pc_loss_long'] = len(losing_long_trades) / len(self.results['long_trades'])
-                self.results['pc_win_long'] = len(winning_long_trades) / len(self.results['long_trades'])
-
-                self.results['max_long_win'] = long_win_df['Returns'].max()
-                self.results['avg_long_win'] = long_win_df['Returns'].mean()
-                self.results['max_long_loss'] = long_loss_df['Returns'].min()
-                self.results['avg_long_loss'] = long_loss_df['Returns'].mean()
-
-                grouper = (long_df.Outcome != long_df.Outcome.shift()).cumsum()
-                self.results['longest_long_win_streak'] = long_df.groupby(grouper).cumcount().max()  # Todo: Calculate this with a method
-
-            if len(self.results['short_trades']) > 0:
-                winning_short_trades = [trade for trade in self.results['short_trades'] if trade['Outcome'] == '+']
-                losing_short_trades = [trade for trade in self.results['short_trades'] if trade['Outcome'] == '-']
-
-                short_win_df = self._create_dataframe_from_list(winning_short_trades)
-                short_loss_df = self._create_dataframe_from_list(losing_short_trades)
-
-                self.results['pc_win_short'] = len(winning_short_trades) / len(self.results['short_trades'])
-                self.results['pc_loss_short'] = len(losing_short_trades) / len(self.results['short_trades'])
-
-                self.results['max_short_win'] = short_win_df['Returns'].max()
-                self.results['avg_short_win'] = short_win_df['Returns'].mean()
-                self.results['max_short_loss'] = short_loss_df['Returns'].min()
-                self.results['avg_short_loss'] = short_loss_df['Returns'].mean()
-
-                grouper = (short_df.Outcome != short_df.Outcome.shift()).cumsum()
-                self.results['longest_short_win_streak'] = short_df.groupby(grouper).cumcount().max()
+        # self._write_equity_dataframe_to_file(pd.DataFrame({'Time': self.trades.records['open_time'], 'Equity': self.trades.records['balance']}))
+        # self.results['sqn'] = np.sqrt(self.results['amount_of_trades']) * pl.mean() / (pl.std() or np.nan)
 
     def geometric_mean(self, returns: pd.Series) -> float:
         returns = returns.fillna(0) + 1
@@ -499,34 +754,27 @@ class Backtest:
         return np.clip(annualized_return / (-max_dd or np.nan), 0, np.inf)
 
     def _get_dd_metrics(self, equity):
-        dd = 1 - equity / np.maximum.accumulate(equity)
+        # Drawdown of every candle and the duration and depth of every drawdown episode. An episode runs from a
+        # candle at the equity peak to the next one (or the last candle), its depth is one segment reduction.
+        peaks = np.maximum.accumulate(equity.to_numpy(dtype=float))
+        dd = 1 - equity / peaks
 
-        iloc = np.unique(np.r_[(dd == 0).values.nonzero()[0], len(dd) - 1])
-        iloc = pd.Series(iloc, index=dd.index[iloc])
-        df = iloc.to_frame('iloc').assign(prev=iloc.shift())
-        df = df[df['iloc'] > df['prev'] + 1].astype(int)
+        values = dd.to_numpy()
+        iloc = np.unique(np.r_[np.flatnonzero(values == 0), len(values) - 1])
+        is_episode = iloc[1:] > iloc[:-1] + 1
 
         # If no drawdown since no trade, avoid below for pandas sake and return nan series
-        if not len(df):
+        if not is_episode.any():
             return (dd.replace(0, np.nan),) * 3
 
-        df['duration'] = df['iloc'].map(dd.index.__getitem__) - df['prev'].map(dd.index.__getitem__)
-        df['peak_dd'] = df.apply(lambda row: dd.iloc[row['prev']:row['iloc'] + 1].max(), axis=1)
-        df = df.reindex(dd.index)
-
-        return dd, df['duration'], df['peak_dd']
-
-    def _round_timedelta(self, timedelta):
-        days = timedelta.days
-        seconds = timedelta.seconds
-        hours = seconds // 3600
-        minutes = (seconds // 60) % 60
+        # the segments between equity peaks split the curve, the closing candle of each episode is added separately
+        segment_max = np.maximum.reduceat(values, iloc)
+        start = iloc[:-1][is_episode]
+        end = iloc[1:][is_episode]
+        depth = np.maximum(segment_max[:-1][is_episode], values[end])
 
-        return f'{days} days, {hours} hours and {minutes} minutes'
+        index = dd.index[end]
+        duration = pd.Series(dd.index[end] - dd.index[start], index=index)
 
-    def _get_expectancy_ratio(self):
-        win_ratio = self.results['pc_win']
-        loss_ratio = self.results['pc_loss']
-        reward_to_risk_ratio = self.results['avg_win'] / abs(self.results['avg_loss'])
+        return dd, duration, pd.Series(depth, index=index)
 
-        return (reward_to_risk_ratio * win_ratio) - loss_ratio
@@ -0,0 +1,72 @@
+import numpy as np
+
+
+class BarState:
+    # attribute name -> dataframe column, candle data is read-only
+    price_columns = {
+        'open': 'Open',
+        'high': 'High',
+        'low': 'Low',
+        'close': 'Close'
+    }
+
+    # attribute name -> dataframe column, the bookkeeping columns written by the bar loop
+    columns = {
+        'side': ('Side', np.int8),
+        'enter': ('Enter', np.int64),
+        'entry_price': ('Entry Price', float),
+        'sl_price': ('SL Price', float),
+        'tp_price': ('TP Price', float),
+        'exit': ('Exit', np.int64),
+        'exit_price': ('Exit Price', float),
+        'has_open_position': ('Has Open Position', np.int64),
+        'equity': ('Equity', float)
+    }
+
+    def __init__(self, df):
+        super(BarState, self).__init__()
+
+        self.df = df
+        self.length = len(df)
+
+        # Position of the backtest at the current candle, set by the engine before every on_bar call
+        self.in_position = False
+        self.position_side = 0
+
+        self._extra_columns = {}
+
+        for attribute, column in self.price_columns.items():
+            values = np.ascontiguousarray(df[column].to_numpy(dtype=float))
+            values.flags.writeable = False
+            setattr(self, attribute, values)
+
+        for attribute, (column, dtype) in self.columns.items():
+            values = df[column].to_numpy(dtype=dtype, na_value=0) if column in df else np.zeros(self.length, dtype=dtype)
+            setattr(self, attribute, np.ascontiguousarray(values).copy())
+
+    def __getitem__(self, column):
+        # Indicator columns are converted once and cached as read-only arrays
+        if column not in self._extra_columns:
+            values = np.ascontiguousarray(self.df[column].to_numpy())
+            values.flags.writeable = False
+            self._extra_columns[column] = values
+
+        return self._extra_columns[column]
+
+    def carry(self, index):
+        # Array version of Strategy.set_basic_columns
+        prev_index = index - 1 if index > 0 else 0
+
+        if self.has_open_position[prev_index]:
+            self.has_open_position[index] = self.has_open_position[prev_index]
+        else:
+            self.has_open_position[index] = self.enter[prev_index]
+
+        self.sl_price[index] = self.sl_price[prev_index]
+        self.tp_price[index] = self.tp_price[prev_index]
+
+    def write_back(self):
+        for attribute, (column, dtype) in self.columns.items():
+            self.df[column] = getattr(self, attribute)
+
+        return self.df
@@ -0,0 +1,61 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+cache_path = Path(__file__).parent.parent.parent / 'Historical_Data/Cache'
+
+
+class CandleCache:
+    # Bump when the cleaning in Strategy._get_candle_data changes, old cache files are rebuilt
+    version = 1
+
+    def __init__(self, path=cache_path):
+        super(CandleCache, self).__init__()
+
+        self.path = Path(path)
+
+    def load(self, source_path, name=None):
+        # Returns the cleaned frame of source_path or None when there is no valid cache file for it.
+        # Candles derived from source_path are cached under their own name, they go stale with source_path.
+        cache_file = self._get_cache_file(source_path, name)
+        if not cache_file.is_file():
+            return None
+
+        try:
+            with np.load(cache_file, allow_pickle=False) as data:
+                if data['__source__'].tolist() != self._get_source_stamp(source_path):
+                    return None
+
+                columns = data['__columns__'].tolist()
+                return pd.DataFrame({column: data[column] for column in columns}, columns=columns)
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def save(self, source_path, df, name=None):
+        # Only plain numeric and datetime columns can be stored without pickling
+        if any(dtype == object for dtype in df.dtypes):
+            return
+
+        cache_file = self._get_cache_file(source_path, name)
+        temp_file = cache_file.with_name(f'{cache_file.stem}.{os.getpid()}.tmp')
+
+        try:
+            self.path.mkdir(parents=True, exist_ok=True)
+            with open(temp_file, 'wb') as f:
+                np.savez(f, __source__=np.array(self._get_source_stamp(source_path), dtype=np.int64), __columns__=np.array(df.columns, dtype=str),
+                         **{column: df[column].to_numpy() for column in df.columns})
+
+            # atomic, parallel workers never read a half written file
+            os.replace(temp_file, cache_file)
+        except OSError:
+            if temp_file.exists():
+                temp_file.unlink()
+
+    def _get_cache_file(self, source_path, name=None):
+        return self.path / f'{name or Path(source_path).stem}.npz'
+
+    def _get_source_stamp(self, source_path):
+        stat = os.stat(source_path)
+        return [self.version, stat.st_mtime_ns, stat.st_size]
@@ -0,0 +1,95 @@
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+store_path = Path(__file__).parent.parent.parent / 'Historical_Data/Store'
+
+
+class CandleStore:
+    # Bump when the layout of the store changes, old series are rebuilt
+    version = 1
+
+    price_columns = ['Open', 'High', 'Low', 'Close', 'Volume']
+    time_columns = ['Open Time', 'Close Time']
+
+    def __init__(self, path=store_path):
+        super(CandleStore, self).__init__()
+
+        self.path = Path(path)
+
+    def open(self, source_path, name=None):
+        # Frame of read-only memory mapped views, every process opening the same series shares one page cache copy.
+        # A series aggregated from source_path is kept under name and rebuilt when source_path changes.
+        series_path = self._get_series_path(source_path, name)
+        meta = self._read_meta(series_path)
+        if meta is None or meta['source'] != self._get_source_stamp(source_path):
+            return None
+
+        length = meta['length']
+        prices_file = series_path / 'prices.f8'
+        times_file = series_path / 'times.i8'
+        try:
+            if not length or prices_file.stat().st_size != 8 * length * len(self.price_columns) or times_file.stat().st_size != 8 * length * len(self.time_columns):
+                return None
+        except OSError:
+            return None
+
+        # column-major files: every column is one contiguous run of fixed-width values
+        prices = np.memmap(prices_file, dtype=np.float64, mode='r', shape=(len(self.price_columns), length))
+        times = np.memmap(times_file, dtype=np.int64, mode='r', shape=(len(self.time_columns), length)).view('M8[ns]')
+
+        # The price block is wrapped as is, only the small time columns get copied when pandas combines them
+        frames = [
+            pd.DataFrame({'Open Time': times[0]}, copy=False),
+            pd.DataFrame(prices.T, columns=self.price_columns, copy=False),
+            pd.DataFrame({'Close Time': times[1]}, copy=False)
+        ]
+
+        return pd.concat(frames, axis=1, copy=False)
+
+    def build(self, source_path, df, name=None):
+        if list(df.columns) != ['Open Time'] + self.price_columns + ['Close Time']:
+            return False
+
+        series_path = self._get_series_path(source_path, name)
+        prices = np.ascontiguousarray(df[self.price_columns].to_numpy(dtype=np.float64).T)
+        times = np.ascontiguousarray(df[self.time_columns].to_numpy(dtype='M8[ns]').T.view(np.int64))
+
+        try:
+            series_path.mkdir(parents=True, exist_ok=True)
+            self._replace_file(series_path / 'prices.f8', prices.tofile)
+            self._replace_file(series_path / 'times.i8', times.tofile)
+
+            # meta goes last, readers never accept a series whose meta doesn't match the files
+            meta = {'version': self.version, 'source': self._get_source_stamp(source_path), 'length': len(df)}
+            self._replace_file(series_path / 'meta.json', lambda f: json.dump(meta, f))
+        except OSError:
+            return False
+
+        return True
+
+    def _replace_file(self, path, write):
+        temp_file = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+        with open(temp_file, 'w' if path.suffix == '.json' else 'wb') as f:
+            write(f)
+
+        os.replace(temp_file, path)
+
+    def _read_meta(self, series_path):
+        try:
+            with open(series_path / 'meta.json', 'r') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        return meta if meta.get('version') == self.version else None
+
+    def _get_series_path(self, source_path, name=None):
+        return self.path / (name or Path(source_path).stem)
+
+    def _get_source_stamp(self, source_path):
+        stat = os.stat(source_path)
+        return [stat.st_mtime_ns, stat.st_size]
@@ -0,0 +1,110 @@
+from collections import deque
+
+import numpy as np
+
+
+class DivergenceEngine:
+    def __init__(self, oscillator, close, low, high, pivots, trigger_candle=1, pivot_period=5, max_pivot=10, max_candles=100, zero_line=None):
+        super(DivergenceEngine, self).__init__()
+
+        self.oscillator = np.asarray(oscillator, dtype=float).tolist()
+        self.close = np.asarray(close, dtype=float).tolist()
+        self.low = np.asarray(low, dtype=float).tolist()
+        self.high = np.asarray(high, dtype=float).tolist()
+        self.pivots = np.asarray(pivots).tolist()
+
+        self.trigger_candle = trigger_candle
+        self.pivot_period = pivot_period
+        self.max_candles = max_candles
+        # When set, bullish divergences need the oscillator below and bearish ones above this line
+        self.zero_line = zero_line
+
+        # Rolling index of the most recent pivot lows and highs before the candle being evaluated
+        self.pivot_lows = deque(maxlen=max_pivot)
+        self.pivot_highs = deque(maxlen=max_pivot)
+        self._next_pivot = 0
+
+    def get_signals(self):
+        # 1 = hidden bullish, 2 = regular bullish, -1 = hidden bearish, -2 = regular bearish, 0 = no divergence
+        return np.array([self.update(candle) for candle in range(len(self.close))], dtype=int)
+
+    def update(self, candle):
+        # Candles have to be evaluated in order, each call only indexes the pivots it hasn't seen yet
+        previous_candle = candle - self.trigger_candle
+
+        while self._next_pivot < previous_candle:
+            if self.pivots[self._next_pivot] == 1:
+                self.pivot_lows.append(self._next_pivot)
+            elif self.pivots[self._next_pivot] == 2:
+                self.pivot_highs.append(self._next_pivot)
+            self._next_pivot += 1
+
+        if previous_candle < 0 or self.pivots[previous_candle] not in (1, 2):
+            return 0
+
+        if self._has_divergence(candle, self.pivot_lows, bullish=True, hidden=True):
+            return 1
+        elif self._has_divergence(candle, self.pivot_lows, bullish=True, hidden=False):
+            return 2
+        elif self._has_divergence(candle, self.pivot_highs, bullish=False, hidden=True):
+            return -1
+        elif self._has_divergence(candle, self.pivot_highs, bullish=False, hidden=False):
+            return -2
+        else:
+            return 0
+
+    def _has_divergence(self, candle, pivots, bullish, hidden):
+        oscillator = self.oscillator
+        close = self.close
+        previous_candle = candle - self.trigger_candle
+        direction = 1 if bullish else -1
+
+        # price has to move away from the previous candle in the direction of the divergence
+        if not (direction * oscillator[candle] > direction * oscillator[previous_candle] or direction * close[candle] > direction * close[previous_candle]):
+            return False
+
+        # hidden bullish and regular bearish: lower oscillator with a higher close, the other two the opposite
+        lower_oscillator = bullish == hidden
+
+        arrived = False
+        for pivot in reversed(pivots):
+            lenght = candle - pivot + self.pivot_period
+            if pivot == 0 or lenght > self.max_candles:
+                continue
+
+            if lower_oscillator:
+                is_divergence = oscillator[previous_candle] < oscillator[pivot] and close[previous_candle] > close[pivot]
+            else:
+                is_divergence = oscillator[previous_candle] > oscillator[pivot] and close[previous_candle] < close[pivot]
+
+            if self.zero_line is not None:
+                is_divergence = is_divergence and direction * oscillator[previous_candle] < direction * self.zero_line and direction * oscillator[pivot] < direction * self.zero_line
+
+            if lenght > 5 and is_divergence:
+                # the previous result is overwritten, the oldest qualifying pivot decides
+                arrived = self._is_line_clear(previous_candle, pivot, bullish)
+
+        return arrived
+
+    def _is_line_clear(self, previous_candle, pivot, bullish):
+        # No candle between the pivot and the previous candle may cross the lines connecting both
+        oscillator = self.oscillator
+        close = self.close
+
+        slope1 = (oscillator[previous_candle] - oscillator[pivot]) / (previous_candle - pivot)
+        virtual_line1 = oscillator[previous_candle] - slope1
+        slope2 = (close[previous_candle] - close[pivot]) / (previous_candle - pivot)
+        virtual_line2 = (self.low[previous_candle] if bullish else self.high[previous_candle]) - slope2
+
+        for index in range(previous_candle - 1, pivot + 1, -1):
+            if bullish:
+                if oscillator[index] < virtual_line1 or close[index] < virtual_line2:
+                    return False
+            else:
+                if oscillator[index] > virtual_line1 or close[index] > virtual_line2:
+                    return False
+
+            virtual_line1 -= slope1
+            virtual_line2 -= slope2
+
+        return True
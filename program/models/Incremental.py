@@ -0,0 +1,461 @@
+import math
+from collections import deque
+
+# Indicators fed one candle at a time for forward testing. Every update takes constant time whatever the number of
+# candles seen so far and returns what the batch version (talib or the pandas code of the strategies) gives for that
+# candle, NaN while warming up. Leading NaNs are skipped like the talib wrapper does.
+
+
+class Ema:
+    # talib.EMA: seeded with the mean of the first period values
+    def __init__(self, period):
+        super(Ema, self).__init__()
+
+        self.period = period
+        self.k = 2 / (period + 1)
+        self.count = 0
+        self.total = 0.0
+        self.value = math.nan
+
+    def update(self, value):
+        if self.count < self.period:
+            if not self.count and math.isnan(value):
+                return math.nan
+
+            self.count += 1
+            self.total += value
+            if self.count == self.period:
+                self.value = self.total / self.period
+
+            return self.value
+
+        self.value = (value - self.value) * self.k + self.value
+        return self.value
+
+
+class Sma:
+    # talib.SMA: one running total, the newest value is added before the oldest one leaves
+    def __init__(self, period):
+        super(Sma, self).__init__()
+
+        self.period = period
+        self.values = deque()
+        self.total = 0.0
+
+    def update(self, value):
+        if not self.values and math.isnan(value):
+            return math.nan
+
+        self.values.append(value)
+        self.total += value
+        if len(self.values) < self.period:
+            return math.nan
+
+        mean = self.total / self.period
+        self.total -= self.values.popleft()
+
+        return mean
+
+
+class Atr:
+    # talib.ATR: Wilder's smoothing of the true range, seeded with the mean of the first period true ranges
+    def __init__(self, period):
+        super(Atr, self).__init__()
+
+        self.period = period
+        self.previous_close = math.nan
+        self.count = 0
+        self.total = 0.0
+        self.value = math.nan
+
+    def update(self, high, low, close):
+        previous_close, self.previous_close = self.previous_close, close
+        if math.isnan(previous_close):
+            # the first candle has no true range
+            return math.nan
+
+        true_range = max(high - low, abs(previous_close - high), abs(low - previous_close))
+        if self.count < self.period:
+            self.count += 1
+            self.total += true_range
+            if self.count == self.period:
+                self.value = self.total / self.period
+
+            return self.value
+
+        self.value = (self.value * (self.period - 1) + true_range) / self.period
+        return self.value
+
+
+class Macd:
+    # talib.MACD: the fast EMA starts slow - fast candles late so both EMAs seed on the same candle,
+    # the line, signal and histogram are NaN until the signal EMA is seeded
+    def __init__(self, fast_period, slow_period, signal_period):
+        super(Macd, self).__init__()
+
+        self.fast_start = slow_period - fast_period
+        self.count = 0
+        self.fast = Ema(fast_period)
+        self.slow = Ema(slow_period)
+        self.signal = Ema(signal_period)
+
+    def update(self, value):
+        if not self.count and math.isnan(value):
+            return math.nan, math.nan, math.nan
+
+        self.count += 1
+        slow = self.slow.update(value)
+        fast = self.fast.update(value) if self.count > self.fast_start else math.nan
+
+        line = fast - slow
+        signal = self.signal.update(line)
+        if math.isnan(signal):
+            return math.nan, math.nan, math.nan
+
+        return line, signal, line - signal
+
+
+class Rsi:
+    # talib.RSI: Wilder's smoothing of gains and losses, 0 when both are (nearly) zero
+    def __init__(self, period):
+        super(Rsi, self).__init__()
+
+        self.period = period
+        self.previous = math.nan
+        self.count = 0
+        self.gain = 0.0
+        self.loss = 0.0
+
+    def update(self, value):
+        previous, self.previous = self.previous, value
+        if math.isnan(previous):
+            return math.nan
+
+        change = value - previous
+        if self.count < self.period:
+            self.count += 1
+            if change < 0:
+                self.loss -= change
+            else:
+                self.gain += change
+
+            if self.count < self.period:
+                return math.nan
+        else:
+            self.loss *= self.period - 1
+            self.gain *= self.period - 1
+            if change < 0:
+                self.loss -= change
+            else:
+                self.gain += change
+
+        self.loss /= self.period
+        self.gain /= self.period
+
+        total = self.gain + self.loss
+        return 0.0 if -1e-14 < total < 1e-14 else 100 * (self.gain / total)
+
+
+class RollingMean:
+    # pandas rolling(window).mean(): NaN unless the last window values are all numbers
+    def __init__(self, window):
+        super(RollingMean, self).__init__()
+
+        self.window = window
+        self.values = deque(maxlen=window)
+
+    def update(self, value):
+        self.values.append(value)
+        if len(self.values) < self.window:
+            return math.nan
+
+        return math.fsum(self.values) / self.window
+
+
+class RollingRange:
+    # pandas rolling(window).min() and .max() from monotonic queues, NaN unless the last window values are all numbers
+    def __init__(self, window):
+        super(RollingRange, self).__init__()
+
+        self.window = window
+        self.index = -1
+        self.last_nan = -1
+        self.minima = deque()
+        self.maxima = deque()
+
+    def update(self, value):
+        self.index += 1
+        if math.isnan(value):
+            self.last_nan = self.index
+            self.minima.clear()
+            self.maxima.clear()
+        else:
+            while self.minima and self.minima[-1][1] >= value:
+                self.minima.pop()
+            while self.maxima and self.maxima[-1][1] <= value:
+                self.maxima.pop()
+            self.minima.append((self.index, value))
+            self.maxima.append((self.index, value))
+
+        start = self.index - self.window + 1
+        while self.minima and self.minima[0][0] < start:
+            self.minima.popleft()
+        while self.maxima and self.maxima[0][0] < start:
+            self.maxima.popleft()
+
+        if start < 0 or self.last_nan >= start:
+            return math.nan, math.nan
+
+        return self.minima[0][1], self.maxima[0][1]
+
+
+class StochRsi:
+    # K and D of EmaStochRsiDivergence: the stochastic of the forward filled RSI over stoch_period candles,
+    # K is its k_period mean and D the d_period mean of the forward filled K
+    def __init__(self, rsi_period, stoch_period, k_period, d_period):
+        super(StochRsi, self).__init__()
+
+        self.rsi = Rsi(rsi_period)
+        self.filled_rsi = ForwardFill()
+        self.range = RollingRange(stoch_period)
+        self.k = RollingMean(k_period)
+        self.filled_k = ForwardFill()
+        self.d = RollingMean(d_period)
+        self.filled_d = ForwardFill()
+
+    def update(self, close):
+        rsi = self.filled_rsi.update(self.rsi.update(close))
+        lowest, highest = self.range.update(rsi)
+        k = self.filled_k.update(self.k.update(divide(rsi - lowest, highest - lowest) * 100))
+
+        return k, self.filled_d.update(self.d.update(k))
+
+
+class Wavetrend:
+    # WT1 and WT2 of the wavetrend strategies: EMAs of the hlc3 channel index and an SMA of WT1
+    def __init__(self, channel_length, average_length, ma_length):
+        super(Wavetrend, self).__init__()
+
+        self.esa = Ema(channel_length)
+        self.de = Ema(channel_length)
+        self.wt1 = Ema(average_length)
+        self.wt2 = Sma(ma_length)
+
+    def update(self, high, low, close):
+        source = (high + low + close) / 3
+        esa = self.esa.update(source)
+        de = self.de.update(abs(source - esa))
+        wt1 = self.wt1.update(divide(source - esa, 0.015 * de))
+
+        return wt1, self.wt2.update(wt1)
+
+
+class MoneyFlow:
+    # MFI of VumanchuEmasMfi: the SMA of the forward filled candle body to range ratio, shifted down by pos_y
+    def __init__(self, period, multiplier, pos_y):
+        super(MoneyFlow, self).__init__()
+
+        self.multiplier = multiplier
+        self.pos_y = pos_y
+        self.source = ForwardFill()
+        self.sma = Sma(period)
+
+    def update(self, open_price, high, low, close):
+        source = self.source.update(divide(close - open_price, high - low) * self.multiplier)
+
+        return self.sma.update(source) - self.pos_y
+
+
+class Supertrend:
+    # SupertrendEmaTrailing._set_supertrend: bands around hl2 from an adjusted EWM of the true range, the trend starts
+    # True and the band on the other side of the trend is NaN. Returns the trend and the final lower and upper band.
+    def __init__(self, period, multiplier):
+        super(Supertrend, self).__init__()
+
+        self.multiplier = multiplier
+        self.min_periods = period
+        self.decay = 1 - 1 / period
+
+        self.previous_close = math.nan
+        self.candles = 0
+        self.weighted = math.nan
+        self.old_weight = 1.0
+        self.observations = 0
+
+        self.trend = True
+        self.lowerband = math.nan
+        self.upperband = math.nan
+
+    def update(self, high, low, close):
+        if math.isnan(self.previous_close):
+            true_range = abs(high - low)
+        else:
+            true_range = max(abs(high - low), abs(high - self.previous_close), abs(self.previous_close - low))
+        atr = self._update_ewm(true_range)
+
+        hl2 = (high + low) / 2
+        upperband = hl2 + self.multiplier * atr
+        lowerband = hl2 - self.multiplier * atr
+
+        if not math.isnan(self.previous_close):
+            if close > self.upperband:
+                self.trend = True
+            elif close < self.lowerband:
+                self.trend = False
+            else:
+                if self.trend and lowerband < self.lowerband:
+                    lowerband = self.lowerband
+                if not self.trend and upperband > self.upperband:
+                    upperband = self.upperband
+
+            if self.trend:
+                upperband = math.nan
+            else:
+                lowerband = math.nan
+
+        self.previous_close = close
+        self.lowerband = lowerband
+        self.upperband = upperband
+
+        return self.trend, lowerband, upperband
+
+    def _update_ewm(self, value):
+        # pandas ewm(alpha, adjust=True).mean() of one more value
+        is_observation = not math.isnan(value)
+        self.observations += is_observation
+        self.candles += 1
+
+        if self.candles == 1:
+            self.weighted = value
+        elif not math.isnan(self.weighted):
+            self.old_weight *= self.decay
+            if is_observation:
+                if self.weighted != value:
+                    self.weighted = (self.old_weight * self.weighted + value) / (self.old_weight + 1)
+                self.old_weight += 1
+        elif is_observation:
+            self.weighted = value
+
+        return self.weighted if self.observations >= self.min_periods else math.nan
+
+
+class SteppedEma:
+    # Timeframes.stepped_ema: the EMA of the close sampled every step (a tf shorter than the candles), a close counts
+    # once for every step until the next candle opens. The steps of a close are only known when the next candle opens,
+    # so they are applied then, the value of a candle is the EMA after its first step. Times are integer nanoseconds.
+    def __init__(self, period, step):
+        super(SteppedEma, self).__init__()
+
+        self.period = period
+        self.step = step
+        self.decay = 1 - 2 / (period + 1)
+
+        self.first_time = None
+        self.previous = math.nan
+        self.previous_steps = 0
+
+        self.count = 0
+        self.total = 0.0
+        self.average = 0.0
+
+    def update(self, value, time):
+        if self.first_time is None:
+            self.first_time = time
+        steps = -((self.first_time - time) // self.step)
+        if not math.isnan(self.previous):
+            self._repeat(self.previous, steps - self.previous_steps)
+
+        self.previous = value
+        self.previous_steps = steps
+
+        if self.count < self.period:
+            return (self.total + value) / self.period if self.count == self.period - 1 else math.nan
+
+        return value + self.decay * (self.average - value)
+
+    def _repeat(self, value, repeat):
+        # after repeat steps of one value the average is value + decay ** repeat * (average - value)
+        if self.count < self.period:
+            used = min(repeat, self.period - self.count)
+            self.total += value * used
+            self.count += repeat
+            if self.count >= self.period:
+                self.average = value + self.decay ** (repeat - used) * (self.total / self.period - value)
+
+            return
+
+        self.average = value + self.decay ** repeat * (self.average - value)
+        self.count += repeat
+
+
+class ResampledEma:
+    # Timeframes.align of the EMA of the tf candles (a tf as long as the candles or longer): every candle gets the EMA
+    # of the last tf candle that is complete by then. A tf candle is complete at the last candle opening in it, the one
+    # the next candle_step doesn't open in anymore. The batch version also counts a tf candle as complete at the last candle
+    # before a gap in the data and at the last candle of all, which only the later candles tell. Times are integer
+    # nanoseconds, origin is where the tf candles start.
+    def __init__(self, period, step, candle_step, origin=0):
+        super(ResampledEma, self).__init__()
+
+        self.step = step
+        self.candle_step = candle_step
+        self.origin = origin
+
+        self.ema = Ema(period)
+        self.bin = None
+        self.close = math.nan
+        self.value = math.nan
+
+    def update(self, close, time):
+        current = (time - self.origin) // self.step
+        if self.bin is not None and current != self.bin and not math.isnan(self.close):
+            # a gap in the candles ended the previous tf candle before its last candle was seen as such
+            self.value = self.ema.update(self.close)
+        self.bin = current
+        self.close = close
+
+        if (time + self.candle_step - self.origin) // self.step != current:
+            self.value = self.ema.update(close)
+            self.close = math.nan
+
+        return self.value
+
+
+class Cross:
+    # crossovers and crossunders of two series: first was below (above) second on the previous candle and is above (below) it now
+    def __init__(self):
+        super(Cross, self).__init__()
+
+        self.first = math.nan
+        self.second = math.nan
+
+    def update(self, first, second):
+        cross_up = int(self.first < self.second and first > second)
+        cross_down = int(self.first > self.second and first < second)
+        self.first, self.second = first, second
+
+        return cross_up, cross_down
+
+
+class ForwardFill:
+    # pandas ffill: a NaN takes the last number before it
+    def __init__(self):
+        super(ForwardFill, self).__init__()
+
+        self.value = math.nan
+
+    def update(self, value):
+        if not math.isnan(value):
+            self.value = value
+
+        return self.value
+
+
+def divide(numerator, denominator):
+    # Division with the float semantics of pandas and numpy, x / 0 is +-inf and 0 / 0 NaN
+    if denominator:
+        return numerator / denominator
+    if math.isnan(numerator) or math.isnan(denominator) or not numerator:
+        return math.nan
+
+    return math.copysign(math.inf, numerator) * math.copysign(1, denominator)
@@ -0,0 +1,125 @@
+import hashlib
+import os
+from pathlib import Path
+
+import numpy as np
+
+indicator_cache_path = Path(__file__).parent.parent.parent / 'Historical_Data/Indicators'
+
+
+class IndicatorCache:
+    # Bump when the way indicators are computed changes, old entries are never read again and age out
+    version = 1
+
+    # Default byte budget, override with INDICATOR_CACHE_BYTES
+    max_bytes = 256 * 1024 * 1024
+
+    def __init__(self, path=indicator_cache_path, max_bytes=None):
+        super(IndicatorCache, self).__init__()
+
+        self.path = Path(path)
+        self.budget = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, symbol, tf, prices, name, params, compute):
+        # Returns the arrays of an indicator, computing and storing them on a miss.
+        # compute returns one array (or Series) or a tuple of them, the cached result has the same shape.
+        if os.getenv('INDICATOR_CACHE', '1') == '0':
+            return self.compute(compute)
+
+        cache_file = self.path / f'{self._get_key(symbol, tf, prices, name, params)}.npz'
+        values = self._load(cache_file)
+        if values is not None:
+            self.hits += 1
+            return values
+
+        self.misses += 1
+        is_tuple, values = self._to_arrays(compute())
+        self._save(cache_file, is_tuple, values)
+
+        return values
+
+    def compute(self, compute):
+        # The arrays of compute() in the shape get returns them, without reading or writing the cache
+        return self._to_arrays(compute())[1]
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+    def get_budget(self):
+        if self.budget is not None:
+            return self.budget
+
+        return int(os.getenv('INDICATOR_CACHE_BYTES', self.max_bytes))
+
+    def _get_key(self, symbol, tf, prices, name, params):
+        # The data fingerprint covers the candles the indicator is computed on, so trimmed or updated data never hits an old entry
+        fingerprint = hashlib.sha1(np.ascontiguousarray(prices, dtype=np.float64).tobytes()).hexdigest()
+        key = repr((self.version, symbol, tf, fingerprint, name, tuple(params)))
+
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def _to_arrays(self, values):
+        if isinstance(values, tuple):
+            return True, tuple(np.asarray(value) for value in values)
+
+        return False, np.asarray(values)
+
+    def _load(self, cache_file):
+        try:
+            with np.load(cache_file, allow_pickle=False) as data:
+                values = tuple(data[f'arr_{index}'] for index in range(len(data.files) - 1))
+                is_tuple = bool(data['__tuple__'])
+
+            # the modification time is the last use, eviction removes the least recently used entries first
+            os.utime(cache_file)
+        except (OSError, KeyError, ValueError):
+            return None
+
+        return values if is_tuple else values[0]
+
+    def _save(self, cache_file, is_tuple, values):
+        if any(value.dtype == object for value in (values if is_tuple else (values,))):
+            return
+
+        temp_file = cache_file.with_name(f'{cache_file.stem}.{os.getpid()}.tmp')
+        try:
+            self.path.mkdir(parents=True, exist_ok=True)
+            with open(temp_file, 'wb') as f:
+                np.savez(f, *(values if is_tuple else (values,)), __tuple__=is_tuple)
+
+            # atomic, parallel workers never read a half written file
+            os.replace(temp_file, cache_file)
+        except OSError:
+            if temp_file.exists():
+                temp_file.unlink()
+            return
+
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for cache_file in self.path.glob('*.npz'):
+            try:
+                stat = cache_file.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, cache_file))
+
+        size = sum(entry[1] for entry in entries)
+        budget = self.get_budget()
+
+        for _, file_size, cache_file in sorted(entries):
+            if size <= budget:
+                break
+
+            try:
+                cache_file.unlink()
+            except OSError:
+                continue
+
+            size -= file_size
+            self.evictions += 1
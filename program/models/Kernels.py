@@ -0,0 +1,263 @@
+import os
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+def jit_enabled():
+    # Numba is optional, without it (or with USE_NUMBA=0) the kernels run as plain Python over lists
+    return njit is not None and os.getenv('USE_NUMBA', '1') != '0'
+
+
+# The kernels below only index their arguments, so the same source runs compiled on arrays and in Python on lists.
+# Outputs are passed in preallocated.
+
+def _supertrend(close, final_upperband, final_lowerband, supertrend):
+    for curr in range(1, len(close)):
+        prev = curr - 1
+
+        # if current close price crosses above upperband
+        if close[curr] > final_upperband[prev]:
+            supertrend[curr] = True
+        # if current close price crosses below lowerband
+        elif close[curr] < final_lowerband[prev]:
+            supertrend[curr] = False
+        # else, the trend continues
+        else:
+            supertrend[curr] = supertrend[prev]
+
+            # adjustment to the final bands
+            if supertrend[curr] and final_lowerband[curr] < final_lowerband[prev]:
+                final_lowerband[curr] = final_lowerband[prev]
+            if not supertrend[curr] and final_upperband[curr] > final_upperband[prev]:
+                final_upperband[curr] = final_upperband[prev]
+
+        # to remove bands according to the trend direction
+        if supertrend[curr]:
+            final_upperband[curr] = np.nan
+        else:
+            final_lowerband[curr] = np.nan
+
+
+def _position_exits(candidates, is_long, sl, tp, high, low, trail_long, trail_short, trailing, entries, exits, exit_prices):
+    # Entries are only taken while flat, exits are checked from the candle after the entry.
+    # With trailing set the stop moves to trail_long/trail_short after every candle that doesn't exit.
+    count = 0
+    position_end = -1
+    length = len(high)
+
+    for candidate in range(len(candidates)):
+        entry = candidates[candidate]
+        if entry <= position_end:
+            continue
+
+        stop_loss = sl[entry]
+        take_profit = tp[entry]
+        long_position = is_long[entry]
+        exit_price = 0.0
+
+        position_end = length
+        for index in range(entry + 1, length):
+            if long_position:
+                if high[index] >= take_profit or low[index] <= stop_loss:
+                    position_end = index
+                    exit_price = take_profit if high[index] >= take_profit else stop_loss
+                    break
+                if trailing:
+                    stop_loss = max(stop_loss, trail_long[index]) if stop_loss else trail_long[index]
+            else:
+                if high[index] >= stop_loss or low[index] <= take_profit:
+                    position_end = index
+                    exit_price = stop_loss if high[index] >= stop_loss else take_profit
+                    break
+                if trailing:
+                    stop_loss = min(stop_loss, trail_short[index]) if stop_loss else trail_short[index]
+
+        entries[count] = entry
+        exit_prices[count] = exit_price
+        if position_end == length:
+            exits[count] = -1
+            count += 1
+            break
+
+        exits[count] = position_end
+        count += 1
+
+    return count
+
+
+def _batch_position_exits(enter, is_long, sl, tp, high, low, trail_long, trail_short, trailing, batch_size, entries, exits, exit_prices, counts):
+    # _position_exits for batch_size parameter sets at once, advanced candle by candle together. sl, tp and the trails hold
+    # one row of length candles per set, flattened, the outputs one row per set with counts[batch] trades in it.
+    # A set that exits on a candle only looks for a new entry from the next one.
+    length = len(high)
+    in_position = [False] * batch_size
+    position_long = [False] * batch_size
+    stop_loss = [0.0] * batch_size
+    take_profit = [0.0] * batch_size
+
+    for index in range(length):
+        for batch in range(batch_size):
+            offset = batch * length
+
+            if in_position[batch]:
+                if position_long[batch]:
+                    if high[index] >= take_profit[batch] or low[index] <= stop_loss[batch]:
+                        in_position[batch] = False
+                        exit_prices[offset + counts[batch]] = take_profit[batch] if high[index] >= take_profit[batch] else stop_loss[batch]
+                    elif trailing:
+                        trail = trail_long[offset + index]
+                        stop_loss[batch] = max(stop_loss[batch], trail) if stop_loss[batch] else trail
+                else:
+                    if high[index] >= stop_loss[batch] or low[index] <= take_profit[batch]:
+                        in_position[batch] = False
+                        exit_prices[offset + counts[batch]] = stop_loss[batch] if high[index] >= stop_loss[batch] else take_profit[batch]
+                    elif trailing:
+                        trail = trail_short[offset + index]
+                        stop_loss[batch] = min(stop_loss[batch], trail) if stop_loss[batch] else trail
+
+                if not in_position[batch]:
+                    exits[offset + counts[batch]] = index
+                    counts[batch] += 1
+            elif enter[index]:
+                in_position[batch] = True
+                position_long[batch] = is_long[index]
+                stop_loss[batch] = sl[offset + index]
+                take_profit[batch] = tp[offset + index]
+                entries[offset + counts[batch]] = index
+
+    for batch in range(batch_size):
+        if in_position[batch]:
+            offset = batch * length
+            exits[offset + counts[batch]] = -1
+            exit_prices[offset + counts[batch]] = 0.0
+            counts[batch] += 1
+
+
+def _repeated_ema(values, repeats, period, ema):
+    # EMA (seeded with the mean of the first period values, like talib) of a series where values[i] is repeated
+    # repeats[i] times, sampled at the first repetition of every value. A run of repetitions is applied at once:
+    # after k of them the average is value + decay ** k * (average - value).
+    decay = 1 - 2 / (period + 1)
+    count = 0
+    total = 0.0
+    average = 0.0
+
+    for index in range(len(values)):
+        value = values[index]
+        repeat = repeats[index]
+
+        if count < period:
+            used = min(repeat, period - count)
+            total += value * used
+            if count + used == period:
+                average = total / period
+                if count == period - 1:
+                    ema[index] = average
+                average = value + decay ** (repeat - used) * (average - value)
+
+            count += repeat
+            continue
+
+        ema[index] = value + decay * (average - value)
+        average = value + decay ** repeat * (average - value)
+        count += repeat
+
+
+if njit is not None:
+    _supertrend_jit = njit(cache=True)(_supertrend)
+    _position_exits_jit = njit(cache=True)(_position_exits)
+    _batch_position_exits_jit = njit(cache=True)(_batch_position_exits)
+    _repeated_ema_jit = njit(cache=True)(_repeated_ema)
+
+
+def supertrend(close, final_upperband, final_lowerband):
+    # Returns the trend direction, the bands are updated in place
+    if jit_enabled():
+        trend = np.ones(len(close), dtype=np.bool_)
+        _supertrend_jit(np.ascontiguousarray(close, dtype=float), final_upperband, final_lowerband, trend)
+        return trend
+
+    upperband = final_upperband.tolist()
+    lowerband = final_lowerband.tolist()
+    trend = [True] * len(close)
+    _supertrend(np.asarray(close, dtype=float).tolist(), upperband, lowerband, trend)
+
+    final_upperband[:] = upperband
+    final_lowerband[:] = lowerband
+    return np.array(trend, dtype=bool)
+
+
+def position_exits(candidates, is_long, sl, tp, high, low, trail_long=None, trail_short=None):
+    # Returns entry indexes, exit indexes (-1 for a position still open at the end) and exit prices
+    trailing = trail_long is not None
+    if not trailing:
+        trail_long = trail_short = np.zeros(0)
+
+    arrays = [np.ascontiguousarray(candidates, dtype=np.int64), np.ascontiguousarray(is_long, dtype=np.bool_)] + \
+             [np.ascontiguousarray(values, dtype=float) for values in (sl, tp, high, low, trail_long, trail_short)]
+
+    if jit_enabled():
+        entries = np.zeros(len(candidates), dtype=np.int64)
+        exits = np.zeros(len(candidates), dtype=np.int64)
+        exit_prices = np.zeros(len(candidates))
+        count = _position_exits_jit(*arrays, trailing, entries, exits, exit_prices)
+        return entries[:count], exits[:count], exit_prices[:count]
+
+    entries = [0] * len(candidates)
+    exits = [0] * len(candidates)
+    exit_prices = [0.0] * len(candidates)
+    count = _position_exits(*[values.tolist() for values in arrays], trailing, entries, exits, exit_prices)
+
+    return np.array(entries[:count], dtype=np.int64), np.array(exits[:count], dtype=np.int64), np.array(exit_prices[:count], dtype=float)
+
+
+def batch_position_exits(enter, is_long, sl, tp, high, low, trail_long=None, trail_short=None):
+    # position_exits for every row of the 2-D sl and tp (and trail) arrays in one pass over the candles.
+    # Returns a list with the entry indexes, exit indexes and exit prices of every row.
+    sl = np.atleast_2d(sl)
+    batch_size, length = sl.shape
+    trailing = trail_long is not None
+    if not trailing:
+        trail_long = trail_short = np.zeros((batch_size, 0))
+
+    arrays = [np.ascontiguousarray(enter, dtype=np.bool_), np.ascontiguousarray(is_long, dtype=np.bool_)] + \
+             [np.ascontiguousarray(values, dtype=float).ravel() for values in (sl, np.atleast_2d(tp))] + \
+             [np.ascontiguousarray(values, dtype=float) for values in (high, low)] + \
+             [np.ascontiguousarray(values, dtype=float).ravel() for values in (trail_long, trail_short)]
+
+    if jit_enabled():
+        entries = np.zeros(batch_size * length, dtype=np.int64)
+        exits = np.zeros(batch_size * length, dtype=np.int64)
+        exit_prices = np.zeros(batch_size * length)
+        counts = np.zeros(batch_size, dtype=np.int64)
+        _batch_position_exits_jit(*arrays, trailing, batch_size, entries, exits, exit_prices, counts)
+    else:
+        entries = [0] * (batch_size * length)
+        exits = [0] * (batch_size * length)
+        exit_prices = [0.0] * (batch_size * length)
+        counts = [0] * batch_size
+        _batch_position_exits(*[values.tolist() for values in arrays], trailing, batch_size, entries, exits, exit_prices, counts)
+
+    entries = np.asarray(entries, dtype=np.int64).reshape(batch_size, length)
+    exits = np.asarray(exits, dtype=np.int64).reshape(batch_size, length)
+    exit_prices = np.asarray(exit_prices, dtype=float).reshape(batch_size, length)
+
+    return [(entries[batch, :count], exits[batch, :count], exit_prices[batch, :count]) for batch, count in enumerate(counts)]
+
+
+def repeated_ema(values, repeats, period):
+    # Returns the EMA of values at the first repetition of every value, NaN before the seed
+    ema = np.full(len(values), np.nan)
+    if jit_enabled():
+        _repeated_ema_jit(np.ascontiguousarray(values, dtype=float), np.ascontiguousarray(repeats, dtype=np.int64), period, ema)
+        return ema
+
+    ema = ema.tolist()
+    _repeated_ema(np.asarray(values, dtype=float).tolist(), np.asarray(repeats, dtype=np.int64).tolist(), period, ema)
+
+    return np.array(ema, dtype=float)
@@ -0,0 +1,145 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from program.models.TradeLedger import TradeLedger
+
+# Trades are grouped by side and outcome into one code, group = 3 * side + outcome
+_SIDES = {TradeLedger.LONG: 0, TradeLedger.SHORT: 1}
+_OUTCOMES = {TradeLedger.WIN: 0, TradeLedger.LOSS: 1, TradeLedger.BREAK_EVEN: 2}
+
+
+def trade_metrics(ledger):
+    # Returns the trade statistics of the results dict for all, long and short trades, and the time spent per step.
+    # Counts, sums and extremes of every (side, outcome) group come out of one grouped pass over the ledger,
+    # the statistics of all trades and of one side are combined from the groups. Without trades they are nan.
+    timings = {}
+    start = time.perf_counter()
+
+    trades = ledger.records
+    amount = len(trades)
+    returns = trades['return']
+    side = np.where(trades['side'] == TradeLedger.LONG, _SIDES[TradeLedger.LONG], _SIDES[TradeLedger.SHORT])
+    outcome = np.select([trades['outcome'] == TradeLedger.WIN, trades['outcome'] == TradeLedger.LOSS], [_OUTCOMES[TradeLedger.WIN], _OUTCOMES[TradeLedger.LOSS]], _OUTCOMES[TradeLedger.BREAK_EVEN])
+    groups = 3 * side + outcome
+
+    start = _lap(timings, 'group', start)
+
+    counts = np.bincount(groups, minlength=6).reshape(2, 3)
+    sums = np.bincount(groups, weights=returns, minlength=6).reshape(2, 3)
+    maxima = np.full(6, -np.inf)
+    minima = np.full(6, np.inf)
+    np.maximum.at(maxima, groups, returns)
+    np.minimum.at(minima, groups, returns)
+    maxima = maxima.reshape(2, 3)
+    minima = minima.reshape(2, 3)
+
+    start = _lap(timings, 'reduce', start)
+
+    streaks = _longest_streaks(outcome, side)
+
+    start = _lap(timings, 'streaks', start)
+
+    growth = trades['return_perc'] + 1
+    gmean_trade_return = 0 if np.any(growth <= 0) else np.exp(np.log(growth).sum() / (amount or np.nan)) - 1
+    durations = trades['close_time'] - trades['open_time']
+
+    metrics = {
+        'winning_trades': ledger.view(outcome=TradeLedger.WIN),
+        'losing_trades': ledger.view(outcome=TradeLedger.LOSS),
+        'break_even_trades': ledger.view(outcome=TradeLedger.BREAK_EVEN),
+        'long_trades': ledger.view(side=TradeLedger.LONG),
+        'short_trades': ledger.view(side=TradeLedger.SHORT)
+    }
+
+    win_count, loss_count, break_even_count = counts.sum(axis=0)
+    metrics['pc_win'] = _mean(win_count, amount)
+    metrics['pc_loss'] = _mean(loss_count, amount)
+    metrics['pc_breakeven'] = 100 * _mean(break_even_count, amount)
+
+    metrics['max_win'] = _extreme(maxima[:, 0].max(), win_count)
+    metrics['avg_win'] = _mean(sums[:, 0].sum(), win_count)
+    metrics['max_loss'] = _extreme(minima[:, 1].min(), loss_count)
+    metrics['avg_loss'] = _mean(sums[:, 1].sum(), loss_count)
+
+    metrics['longest_win_streak'] = streaks[0]
+
+    metrics['avg_trade_perc'] = gmean_trade_return * 100
+    metrics['max_trade_duration'] = _round_timedelta(pd.Timedelta(durations.max())) if amount else np.nan
+    metrics['avg_trade_duration'] = _round_timedelta(pd.Timedelta(durations.astype(np.int64).mean())) if amount else np.nan
+
+    metrics['profit_factor'] = sums[:, 0].sum() / abs(sums[:, 1].sum()) if amount else np.nan
+    metrics['expectancy_perc'] = (metrics['avg_win'] / abs(metrics['avg_loss'])) * metrics['pc_win'] - metrics['pc_loss']
+
+    for index, name in enumerate(('long', 'short')):
+        side_count = counts[index].sum()
+        if not side_count:
+            continue
+
+        metrics[f'pc_win_{name}'] = counts[index, 0] / side_count
+        metrics[f'pc_loss_{name}'] = counts[index, 1] / side_count
+
+        metrics[f'max_{name}_win'] = _extreme(maxima[index, 0], counts[index, 0])
+        metrics[f'avg_{name}_win'] = _mean(sums[index, 0], counts[index, 0])
+        metrics[f'max_{name}_loss'] = _extreme(minima[index, 1], counts[index, 1])
+        metrics[f'avg_{name}_loss'] = _mean(sums[index, 1], counts[index, 1])
+
+        metrics[f'longest_{name}_win_streak'] = streaks[index + 1]
+
+    _lap(timings, 'metrics', start)
+
+    return metrics, timings
+
+
+def _longest_streaks(outcome, side):
+    # Longest run of equal outcomes minus one, over all trades and within each side, nan when there are no trades.
+    # Stable sorting by side keeps the order of the trades of one side, a run also ends where the side changes.
+    streaks = [np.nan] * 3
+    if not len(outcome):
+        return streaks
+
+    streaks[0] = _run_lengths(outcome != np.roll(outcome, 1)).max() - 1
+
+    order = np.argsort(side, kind='stable')
+    side, outcome = side[order], outcome[order]
+    run_starts = (outcome != np.roll(outcome, 1)) | (side != np.roll(side, 1))
+    lengths = _run_lengths(run_starts)
+    run_sides = side[run_starts]
+    for index in range(2):
+        side_lengths = lengths[run_sides == index]
+        if len(side_lengths):
+            streaks[index + 1] = side_lengths.max() - 1
+
+    return streaks
+
+
+def _run_lengths(run_starts):
+    run_starts[0] = True
+    starts = np.flatnonzero(run_starts)
+
+    return np.diff(np.r_[starts, len(run_starts)])
+
+
+def _extreme(value, count):
+    return value if count else np.nan
+
+
+def _mean(total, count):
+    return total / count if count else np.nan
+
+
+def _round_timedelta(timedelta):
+    days = timedelta.days
+    seconds = timedelta.seconds
+    hours = seconds // 3600
+    minutes = (seconds // 60) % 60
+
+    return f'{days} days, {hours} hours and {minutes} minutes'
+
+
+def _lap(timings, name, start):
+    now = time.perf_counter()
+    timings[name] = now - start
+
+    return now
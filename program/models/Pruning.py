@@ -0,0 +1,28 @@
+class PruningRules:
+    # Stops a backtest as soon as it can't pass the checks done on its results anymore.
+    # max_drawdown is in percent of the equity peak, min_balance an absolute floor and min_trades the number of trades
+    # a run needs. The trade rate is only extrapolated once min_progress of the candles has been simulated.
+    def __init__(self, max_drawdown=None, min_balance=None, min_trades=None, min_progress=0.25):
+        super(PruningRules, self).__init__()
+
+        self.max_drawdown = max_drawdown
+        self.min_balance = min_balance
+        self.min_trades = min_trades
+        self.min_progress = min_progress
+
+    def check(self, balance, peak_balance, trades, index, length):
+        # Returns why the run is pruned at candle index out of length, None while it can still pass
+        if self.min_balance is not None and balance < self.min_balance:
+            return 'Balance of ${} below the floor of ${}'.format(round(balance, 2), self.min_balance)
+
+        if self.max_drawdown is not None and peak_balance > 0:
+            drawdown = 100 * (1 - balance / peak_balance)
+            if drawdown > self.max_drawdown:
+                return 'Drawdown of {}% exceeds the maximum of {}%'.format(round(drawdown, 2), self.max_drawdown)
+
+        if self.min_trades and index + 1 >= self.min_progress * length:
+            projected_trades = trades * length / (index + 1)
+            if projected_trades < self.min_trades:
+                return 'On pace for {} trades, need {}'.format(int(projected_trades), self.min_trades)
+
+        return None
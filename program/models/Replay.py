@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+
+from program.models.TradeLedger import TradeLedger
+
+
+def replay_trades(backtest, risks, commissions):
+    # Rebooks the trades of a finished backtest for every (risk, commission) pair, risks and commissions are broadcast
+    # against each other. Entries and exits don't depend on position sizing, so only the balances are compounded again:
+    # each trade multiplies the balance by 1 + exposure * (return - fee rate), with exposure = risk / stop loss distance.
+    # Returns one backtest per pair with its balance, fees, trades and, when a full run would have them, its results.
+    # The balances are laid out over the open times of the candles of the run. After a streaming run only the last chunk
+    # is left in the dataframe, its compressed equity curve keeps the candles every entry and exit changes the balance at.
+    risks, commissions = np.broadcast_arrays(np.atleast_1d(np.asarray(risks, dtype=float)), np.atleast_1d(np.asarray(commissions, dtype=float)))
+    if backtest.equity is None:
+        open_times = backtest.strategy.df['Open Time'].to_numpy(dtype='datetime64[ns]')
+    else:
+        open_times = backtest.equity.index.to_numpy(dtype='datetime64[ns]')
+    trades = backtest.trades.records
+
+    # the exit candle is the last one opening at or before the close time
+    entries = np.searchsorted(open_times, trades['open_time'])
+    exits = np.searchsorted(open_times, trades['close_time'], side='right') - 1
+
+    fee_rates = 3 * commissions[:, None] / 100
+    exposures = (risks[:, None] / 100) / (np.abs(trades['price'] - trades['stop_loss']) / trades['price'])
+    growth = 1 + exposures * (trades['return_perc'] - fee_rates)
+
+    balances = backtest.starting_balance * np.cumprod(growth, axis=1)
+    balances_before = np.hstack([np.full((len(risks), 1), float(backtest.starting_balance)), balances[:, :-1]])
+    sizes = balances_before * exposures
+    fees = sizes * fee_rates
+    final_balances = balances[:, -1] if len(trades) else np.full(len(risks), float(backtest.starting_balance))
+
+    # balance at the start of every candle, it changes the candle after an entry (fee) and after an exit (return)
+    change_candles = np.ravel(np.column_stack([entries + 1, exits + 1]))
+    change_balances = np.stack([balances_before - fees, balances], axis=2).reshape(len(risks), -1)
+
+    open_fees = np.zeros(len(risks))
+    if backtest.open_trade is not None:
+        # the position still open at the end pays its fee without being booked
+        trade = backtest.open_trade
+        exposure = (risks / 100) / (abs(trade['Price'] - trade['Stop Loss']) / trade['Price'])
+        open_fees = final_balances * exposure * fee_rates[:, 0]
+
+        open_candle = np.searchsorted(open_times, np.datetime64(trade['Open Time']))
+        change_candles = np.r_[change_candles, open_candle + 1]
+        change_balances = np.hstack([change_balances, (final_balances - open_fees)[:, None]])
+        final_balances = final_balances - open_fees
+
+    change = np.searchsorted(change_candles, np.arange(len(open_times)), side='right') - 1
+    equity = np.where(change >= 0, change_balances[:, np.maximum(change, 0)], float(backtest.starting_balance))
+    equity_index = pd.DatetimeIndex(open_times, name='Open Time')
+
+    replayed = []
+    for index, (risk, commission) in enumerate(zip(risks.tolist(), commissions.tolist())):
+        result = type(backtest)(backtest.strategy, backtest.starting_balance, risk, commission=commission)
+        result.start_date = backtest.start_date
+        result.end_date = backtest.end_date
+        result.open_trade = backtest.open_trade
+        result.balance = float(final_balances[index])
+        result.fees = float(fees[index].sum() + open_fees[index])
+
+        result.trades = TradeLedger.from_records(trades)
+        result.trades.records['size'] = sizes[index]
+        result.trades.records['return'] = trades['return_perc'] * sizes[index]
+        result.trades.records['balance'] = balances[index]
+
+        curve = pd.Series(equity[index], index=equity_index)
+        if backtest.equity is not None:
+            result.equity = curve
+
+        # same checks as Backtest.run before it calculates results
+        if result.balance > result.starting_balance and len(result.trades) >= 50:
+            result._calculate_results(curve)
+
+        replayed.append(result)
+
+    return replayed
@@ -0,0 +1,145 @@
+import numpy as np
+
+from program.models.Kernels import batch_position_exits, jit_enabled, position_exits
+
+
+def simulate_fixed_exits(enter, side, sl, tp, high, low):
+    # Returns the entry candles, exit candles and exit prices of every trade a strategy with a fixed
+    # stop loss and take profit takes. An exit index of -1 means the last trade was still open at the end.
+    # Only entries while flat count, the candle of the previous exit can't open a new position.
+    if jit_enabled():
+        return position_exits(np.flatnonzero(enter), np.asarray(side) == 1, sl, tp, high, low)
+
+    # without Numba every trade jumps from its entry straight to its exit candle
+    is_long = np.asarray(side) == 1
+    sl = np.asarray(sl, dtype=float)
+    tp = np.asarray(tp, dtype=float)
+    high = np.asarray(high, dtype=float)
+    low = np.asarray(low, dtype=float)
+
+    entries, exits, exit_prices = [], [], []
+    position_end = -1
+    for entry in np.flatnonzero(enter).tolist():
+        if entry <= position_end:
+            continue
+
+        exit_index = find_exit(high, low, entry + 1, tp[entry], sl[entry], is_long[entry])
+        entries.append(entry)
+        exits.append(exit_index)
+        if exit_index == -1:
+            exit_prices.append(0.0)
+            break
+
+        exit_prices.append(exit_price(high[exit_index], tp[entry], sl[entry], is_long[entry]))
+        position_end = exit_index
+
+    return np.array(entries, dtype=np.int64), np.array(exits, dtype=np.int64), np.array(exit_prices, dtype=float)
+
+
+def find_exit(high, low, start, take_profit, stop_loss, is_long, chunk=64):
+    # First candle from start on where a position with a fixed take profit and stop loss exits, -1 if it never does.
+    # The candles are searched in chunks that double in size, short trades only look at a few candles and long ones
+    # need few array operations.
+    length = len(high)
+    while start < length:
+        end = min(start + chunk, length)
+        if is_long:
+            hits = (high[start:end] >= take_profit) | (low[start:end] <= stop_loss)
+        else:
+            hits = (high[start:end] >= stop_loss) | (low[start:end] <= take_profit)
+
+        first = hits.argmax()
+        if hits[first]:
+            return start + int(first)
+
+        start = end
+        chunk *= 2
+
+    return -1
+
+
+def find_trailing_exit(high, low, start, take_profit, stop_loss, trail, is_long, chunk=64):
+    # find_exit for a stop loss that moves to trail (low - distance for longs, high + distance for shorts) after every
+    # candle that doesn't exit. Within a trade the stop is a running maximum (minimum for shorts) of the trail, so every
+    # chunk gets its stop path from one accumulate call and its first touch from one search.
+    # Returns the exit candle (-1 if there is none) and the stop of every candle from start up to the exit (or the end).
+    length = len(high)
+    stop_paths = []
+    while start < length:
+        end = min(start + chunk, length)
+        stops = _trail_stops(stop_loss, trail[start:end - 1], is_long)
+        if is_long:
+            hits = (high[start:end] >= take_profit) | (low[start:end] <= stops)
+        else:
+            hits = (high[start:end] >= stops) | (low[start:end] <= take_profit)
+
+        first = hits.argmax()
+        if hits[first]:
+            stop_paths.append(stops[:first + 1])
+            return start + int(first), np.concatenate(stop_paths)
+
+        stop_paths.append(stops)
+        stop_loss = _trail_stops(stops[-1], trail[end - 1:end], is_long)[-1]
+        start = end
+        chunk *= 2
+
+    return -1, np.concatenate(stop_paths) if stop_paths else np.zeros(0)
+
+
+def _trail_stops(stop_loss, trail, is_long):
+    # Stop of stop_loss's candle and of every candle after it, each one trailed by the trail of the candle before.
+    # An unset (zero) stop loss takes the trail as is, like the row loop does. NaN trails leave the stop where it is.
+    accumulate = np.fmax.accumulate if is_long else np.fmin.accumulate
+    if stop_loss:
+        return accumulate(np.r_[stop_loss, trail])
+
+    return np.r_[stop_loss, accumulate(trail)]
+
+
+def exit_price(high, take_profit, stop_loss, is_long):
+    # The take profit wins for longs and the stop loss for shorts when a candle touches both
+    if is_long:
+        return take_profit if high >= take_profit else stop_loss
+
+    return stop_loss if high >= stop_loss else take_profit
+
+
+def continue_position(high, low, take_profit, stop_loss, is_long, trail=None):
+    # Exit of a position opened before these candles, checked from the first candle on with stop_loss as its stop.
+    # Returns the exit candle (-1 if the position is still open after the last one), the exit price and the stop loss
+    # at the exit or, for a position still open, the stop loss of the first candle after these ones.
+    if trail is None:
+        exit_index = find_exit(high, low, 0, take_profit, stop_loss, is_long)
+        stop = stop_loss
+    else:
+        exit_index, stops = find_trailing_exit(high, low, 0, take_profit, stop_loss, trail, is_long)
+        stop = stops[-1] if len(stops) else stop_loss
+        if exit_index == -1 and len(trail):
+            stop = _trail_stops(stop, trail[-1:], is_long)[-1]
+
+    if exit_index == -1:
+        return -1, 0.0, stop
+
+    return exit_index, exit_price(high[exit_index], take_profit, stop, is_long), stop
+
+
+def simulate_trailing_exits(enter, side, sl, tp, high, low, distance):
+    # Same as simulate_fixed_exits, but after every candle that doesn't exit the stop loss trails to
+    # low - distance for longs and high + distance for shorts, never moving against the position.
+    high = np.asarray(high, dtype=float)
+    low = np.asarray(low, dtype=float)
+    distance = np.asarray(distance, dtype=float)
+
+    return position_exits(np.flatnonzero(enter), np.asarray(side) == 1, sl, tp, high, low, trail_long=low - distance, trail_short=high + distance)
+
+
+def simulate_batch_exits(enter, side, sl, tp, high, low, distance=None):
+    # simulate_fixed_exits (or simulate_trailing_exits with distance) for K parameter sets whose entries are the same,
+    # sl, tp and distance are K x candles arrays. One pass over the candles returns the trades of every set.
+    high = np.asarray(high, dtype=float)
+    low = np.asarray(low, dtype=float)
+    if distance is None:
+        return batch_position_exits(np.asarray(enter) == 1, np.asarray(side) == 1, sl, tp, high, low)
+
+    distance = np.atleast_2d(np.asarray(distance, dtype=float))
+    return batch_position_exits(np.asarray(enter) == 1, np.asarray(side) == 1, sl, tp, high, low, trail_long=low - distance, trail_short=high + distance)
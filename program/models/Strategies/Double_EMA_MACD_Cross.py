@@ -1,5 +1,7 @@
+import numpy as np
 import talib
 
+from program.models.Incremental import Atr, Ema, Macd
 from program.models.Strategies.Strategy import Strategy
 
 
@@ -19,19 +21,55 @@ class DoubleEmaMacdCross(Strategy):
         self.pullback_period = 15
         self.zero_line = 0
 
+        self.vectorized = True
+
     def set_indicators(self):
         self.df = self.df.loc[self.df.notnull().all(axis=1).argmax():]
         self.df.reset_index(inplace=True)
 
-        self.df['LongEMA'] = talib.EMA(self.df['Close'], timeperiod=self.long_ema_period).astype(float).ffill()
-        self.df['ShortEMA'] = talib.EMA(self.df['Close'], timeperiod=self.short_ema_period).astype(float).ffill()
+        self.df['LongEMA'] = self.cached_indicator('EMA', lambda: talib.EMA(self.df['Close'], timeperiod=self.long_ema_period).astype(float).ffill(), self.long_ema_period)
+        self.df['ShortEMA'] = self.cached_indicator('EMA', lambda: talib.EMA(self.df['Close'], timeperiod=self.short_ema_period).astype(float).ffill(), self.short_ema_period)
+
+        self.df['ATR'] = self.cached_indicator('ATR', lambda: talib.ATR(self.df['High'], self.df['Low'], self.df['Close'], timeperiod=self.atr_period).astype(float).ffill(), self.atr_period)
+
+        macd = self.cached_indicator('MACD', lambda: talib.MACD(self.df['Close'], self.MACD_fast_period, self.MACD_slow_period, 9), self.MACD_fast_period, self.MACD_slow_period, 9)
+        self.df['MACD Line'], self.df['MACD Signal'], self.df['MACD Histogram'] = macd
+
+    def set_signals(self):
+        side = self._get_side()
+
+        enter = self.pullbacks(side, self.pullback_period) & self.zero_crosses('MACD Histogram', side, self.zero_line)
+
+        self.df['Side'] = side
+        self.df['Enter'] = enter.astype(int)
+
+    def set_stops(self):
+        close = self.df['Close'].to_numpy()
+        enter = self.df['Enter'].to_numpy() == 1
+        stop_loss = np.where(self.df['Side'] == 1, self.df['Low'] - self.df['ATR'] * self.atr_multiplier, self.df['High'] + self.df['ATR'] * self.atr_multiplier)
+
+        self.df['SL Price'] = np.where(enter, stop_loss, 0.0)
+        self.df['TP Price'] = np.where(enter, close + self.risk_reward * (close - stop_loss), 0.0)
+
+    def get_incremental_indicators(self):
+        long_ema = Ema(self.long_ema_period)
+        short_ema = Ema(self.short_ema_period)
+        atr = Atr(self.atr_period)
+        macd = Macd(self.MACD_fast_period, self.MACD_slow_period, 9)
 
-        self.df['ATR'] = talib.ATR(self.df['High'], self.df['Low'], self.df['Close'], timeperiod=self.atr_period).astype(float).ffill()
+        return {
+            'LongEMA': lambda row: long_ema.update(row['Close']),
+            'ShortEMA': lambda row: short_ema.update(row['Close']),
+            'ATR': lambda row: atr.update(row['High'], row['Low'], row['Close']),
+            ('MACD Line', 'MACD Signal', 'MACD Histogram'): lambda row: macd.update(row['Close'])
+        }
 
-        self.df['MACD Line'], self.df['MACD Signal'], self.df['MACD Histogram'] = talib.MACD(self.df['Close'], self.MACD_fast_period, self.MACD_slow_period, 9)
+    def _get_side(self):
+        close = self.df['Close'].to_numpy(dtype=float)
+        short_ema = self.df['ShortEMA'].to_numpy(dtype=float)
+        long_ema = self.df['LongEMA'].to_numpy(dtype=float)
 
-    def _get_side(self, row):
-        return 1 if float(row['Close']) > float(row['ShortEMA']) > float(row['LongEMA']) else -1 if float(row['LongEMA']) > float(row['ShortEMA']) > float(row['Close']) else 0
+        return np.select([(close > short_ema) & (short_ema > long_ema), (long_ema > short_ema) & (short_ema > close)], [1, -1], 0).astype(np.int8)
 
     def _enter_trade(self, row):
         return 1 if self._check_pullback(row) and self._check_histogram_crossover(row) else 0
@@ -1,5 +1,7 @@
+import numpy as np
 import talib
 
+from program.models.Incremental import Atr, Ema, Macd
 from program.models.Strategies.Strategy import Strategy
 
 
@@ -23,15 +25,33 @@ class DoubleEmaMacdHist(Strategy):
         self.df = self.df.loc[self.df.notnull().all(axis=1).argmax():]
         self.df.reset_index(inplace=True)
 
-        self.df['LongEMA'] = talib.EMA(self.df['Close'], timeperiod=self.long_ema_period).astype(float).ffill()
-        self.df['ShortEMA'] = talib.EMA(self.df['Close'], timeperiod=self.short_ema_period).astype(float).ffill()
+        self.df['LongEMA'] = self.cached_indicator('EMA', lambda: talib.EMA(self.df['Close'], timeperiod=self.long_ema_period).astype(float).ffill(), self.long_ema_period)
+        self.df['ShortEMA'] = self.cached_indicator('EMA', lambda: talib.EMA(self.df['Close'], timeperiod=self.short_ema_period).astype(float).ffill(), self.short_ema_period)
 
-        self.df['ATR'] = talib.ATR(self.df['High'], self.df['Low'], self.df['Close'], timeperiod=self.atr_period).astype(float).ffill()
+        self.df['ATR'] = self.cached_indicator('ATR', lambda: talib.ATR(self.df['High'], self.df['Low'], self.df['Close'], timeperiod=self.atr_period).astype(float).ffill(), self.atr_period)
 
-        self.df['MACD Line'], self.df['MACD Signal'], self.df['MACD Histogram'] = talib.MACD(self.df['Close'], self.MACD_fast_period, self.MACD_slow_period, 9)
+        macd = self.cached_indicator('MACD', lambda: talib.MACD(self.df['Close'], self.MACD_fast_period, self.MACD_slow_period, 9), self.MACD_fast_period, self.MACD_slow_period, 9)
+        self.df['MACD Line'], self.df['MACD Signal'], self.df['MACD Histogram'] = macd
 
-    def _get_side(self, row):
-        return 1 if float(row['Close']) > float(row['ShortEMA']) > float(row['LongEMA']) else -1 if float(row['LongEMA']) > float(row['ShortEMA']) > float(row['Close']) else 0
+    def get_incremental_indicators(self):
+        long_ema = Ema(self.long_ema_period)
+        short_ema = Ema(self.short_ema_period)
+        atr = Atr(self.atr_period)
+        macd = Macd(self.MACD_fast_period, self.MACD_slow_period, 9)
+
+        return {
+            'LongEMA': lambda row: long_ema.update(row['Close']),
+            'ShortEMA': lambda row: short_ema.update(row['Close']),
+            'ATR': lambda row: atr.update(row['High'], row['Low'], row['Close']),
+            ('MACD Line', 'MACD Signal', 'MACD Histogram'): lambda row: macd.update(row['Close'])
+        }
+
+    def _get_side(self):
+        close = self.df['Close'].to_numpy(dtype=float)
+        short_ema = self.df['ShortEMA'].to_numpy(dtype=float)
+        long_ema = self.df['LongEMA'].to_numpy(dtype=float)
+
+        return np.select([(close > short_ema) & (short_ema > long_ema), (long_ema > short_ema) & (short_ema > close)], [1, -1], 0).astype(np.int8)
 
     def _enter_trade(self, row):
         return 1 if self._check_histogram_entry(row) else 0
@@ -1,6 +1,9 @@
+import numpy as np
 import pandas as pd
 import talib
 
+from program.models.Divergence import DivergenceEngine
+from program.models.Incremental import Ema, ForwardFill, Rsi, StochRsi
 from program.models.Strategies.Strategy import Strategy
 
 
@@ -32,17 +35,35 @@ class EmaStochRsiDivergence(Strategy):
         self.df = self.df.loc[self.df.notnull().all(axis=1).argmax():]
         self.df.reset_index(inplace=True)
 
-        self.df['EMA'] = talib.EMA(self.df['Close'], timeperiod=self.ema_period).astype(float).ffill()
-        self.df['RSI'] = talib.RSI(self.df['Close'], timeperiod=self.rsi_period).astype(float).ffill()
+        self.df['EMA'] = self.cached_indicator('EMA', lambda: talib.EMA(self.df['Close'], timeperiod=self.ema_period).astype(float).ffill(), self.ema_period)
+        self.df['RSI'] = self.cached_indicator('RSI', lambda: talib.RSI(self.df['Close'], timeperiod=self.rsi_period).astype(float).ffill(), self.rsi_period)
 
-        self.df['K'] = self._STOCHK(self.df, period=self.fastk, stoch_period=self.stoch_period).astype(float).ffill()
-        self.df['D'] = self._STOCHD(self.df, period=self.fastd, column='K').astype(float).ffill()
+        self.df['K'] = self.cached_indicator('Stoch RSI K', lambda: self._STOCHK(self.df, period=self.fastk, stoch_period=self.stoch_period).astype(float).ffill(),
+                                             self.rsi_period, self.fastk, self.stoch_period)
+        self.df['D'] = self.cached_indicator('Stoch RSI D', lambda: self._STOCHD(self.df, period=self.fastd, column='K').astype(float).ffill(),
+                                             self.rsi_period, self.fastk, self.stoch_period, self.fastd)
 
-        self.df['pivot'] = self.df.apply(lambda x: self._set_pivot_points(self.df, x.name, self.pivot_period, self.pivot_period), axis=1)
-        self.df['divSignal'] = self.df.apply(lambda row: self._set_div_signal(row), axis=1)
+        self.df['pivot'] = self.cached_indicator('Pivots', lambda: self.pivot_points('Close', self.pivot_period, self.pivot_period), 'Close', self.pivot_period, self.pivot_period)
+        self.df['divSignal'] = self.cached_indicator('RSI Divergence', self._set_div_signal, self.rsi_period, self.trigger_candle, self.pivot_period, self.max_pivot, self.div_max_candles)
 
-    def _get_side(self, row):
-        return 1 if float(row['Close']) > float(row['EMA']) else -1 if float(row['EMA']) > float(row['Close']) else 0
+    def get_incremental_indicators(self):
+        # Pivots and divergences are only known pivot_period candles after the pivot, they stay with the batch indicators
+        ema = Ema(self.ema_period)
+        rsi = Rsi(self.rsi_period)
+        filled_rsi = ForwardFill()
+        stoch_rsi = StochRsi(self.rsi_period, self.stoch_period, self.fastk, self.fastd)
+
+        return {
+            'EMA': lambda row: ema.update(row['Close']),
+            'RSI': lambda row: filled_rsi.update(rsi.update(row['Close'])),
+            ('K', 'D'): lambda row: stoch_rsi.update(row['Close'])
+        }
+
+    def _get_side(self):
+        close = self.df['Close'].to_numpy(dtype=float)
+        ema = self.df['EMA'].to_numpy(dtype=float)
+
+        return np.select([close > ema, ema > close], [1, -1], 0).astype(np.int8)
 
     def set_exit_signals(self, open_trade, index, row):
         if row['Has Open Position']:
@@ -75,17 +96,15 @@ class EmaStochRsiDivergence(Strategy):
         prev_index = row.name - 1 if row.name > 0 else 0
 
         # Todo: Look at the charts and use ATR OR Swing High/Low, not both
-        max_values = self.df['High'].rolling(self.swing_lockback_period).max()
-        min_values = self.df['Low'].rolling(self.swing_lockback_period).min()
 
         if bool(self.df['SL Price'].iloc[prev_index]):
             return float(self.df['SL Price'].iloc[prev_index])
         else:
             if row['Enter']:
                 if row['Side'] == 1:
-                    return float(min_values.iloc[row.name] * 0.99)
+                    return float(self.levels['Swing Low'][row.name] * 0.99)
                 else:
-                    return float(max_values.iloc[row.name] * 1.01)
+                    return float(self.levels['Swing High'][row.name] * 1.01)
             else:
                 return 0
 
@@ -103,154 +122,11 @@ class EmaStochRsiDivergence(Strategy):
             else:
                 return 0
 
-    def _set_pivot_points(self, df, l, n1, n2):  # n1 n2 before and after candle l
-        if l - n1 < 0 or l + n2 >= len(df):
-            return 0
-
-        pividlow = 1
-        pividhigh = 1
-        for i in range(l - n1, l + n2 + 1):
-            if (df['Close'].iloc[l] > df['Close'].iloc[i]):
-                pividlow = 0
-            if (df['Close'].iloc[l] < df['Close'].iloc[i]):
-                pividhigh = 0
-        if pividlow and pividhigh:
-            return 3
-        elif pividlow:
-            return 1
-        elif pividhigh:
-            return 2
-        else:
-            return 0
-
-    def bull_hidden_divergences(self, candleid, pl_index):
-        arrived = False
-        previous_candle = candleid - self.trigger_candle
-        array_filter = pl_index < previous_candle
-        filtered_pl_index = pl_index[array_filter]
-        end = min(self.max_pivot + 1, len(filtered_pl_index) + 1)
-        virtual_line_start = previous_candle - 1
-        if self.df['RSI'].iloc[candleid] > self.df['RSI'].iloc[previous_candle] or self.df['Close'].iloc[candleid] > self.df['Close'].iloc[previous_candle]:
-            for x in range(-1, -end, -1):
-                lenght = candleid - filtered_pl_index[x] + self.pivot_period
-                if filtered_pl_index[x] == 0 or lenght > self.div_max_candles:
-                    continue
-                if lenght > 5 and \
-                        self.df['RSI'].iloc[previous_candle] < self.df['RSI'].iloc[filtered_pl_index[x]] and self.df['Close'].iloc[previous_candle] > self.df['Close'].iloc[filtered_pl_index[x]]:
-                    slope1 = (self.df['RSI'].iloc[previous_candle] - self.df['RSI'].iloc[filtered_pl_index[x]]) / (previous_candle - filtered_pl_index[x])
-                    virtual_line1 = self.df['RSI'].iloc[previous_candle] - slope1
-                    slope2 = (self.df['Close'].iloc[previous_candle] - self.df['Close'].iloc[filtered_pl_index[x]]) / (previous_candle - filtered_pl_index[x])
-                    virtual_line2 = self.df['Low'].iloc[previous_candle] - slope2
-                    arrived = True
-                    for y in range(virtual_line_start, filtered_pl_index[x] + 1, -1):
-                        if self.df['RSI'].iloc[y] < virtual_line1 or self.df['Close'].iloc[y] < virtual_line2:
-                            arrived = False
-                            break
-                        virtual_line1 -= slope1
-                        virtual_line2 -= slope2
-
-        return arrived
-
-    def bull_regular_divergences(self, candleid, pl_index):
-        arrived = False
-        previous_candle = candleid - self.trigger_candle
-        array_filter = pl_index < previous_candle
-        filtered_pl_index = pl_index[array_filter]
-        end = min(self.max_pivot + 1, len(filtered_pl_index) + 1)
-        virtual_line_start = previous_candle - 1
-
-        if self.df['RSI'].iloc[candleid] > self.df['RSI'].iloc[previous_candle] or self.df['Close'].iloc[candleid] > self.df['Close'].iloc[previous_candle]:
-            for x in range(-1, -end, -1):
-                lenght = candleid - filtered_pl_index[x] + self.pivot_period
-                if filtered_pl_index[x] == 0 or lenght > self.div_max_candles:
-                    continue
-                if lenght > 5 and \
-                        self.df['RSI'].iloc[previous_candle] > self.df['RSI'].iloc[filtered_pl_index[x]] and self.df['Close'].iloc[previous_candle] < self.df['Close'].iloc[filtered_pl_index[x]]:
-                    slope1 = (self.df['RSI'].iloc[previous_candle] - self.df['RSI'].iloc[filtered_pl_index[x]]) / (previous_candle - filtered_pl_index[x])
-                    virtual_line1 = self.df['RSI'].iloc[previous_candle] - slope1
-                    slope2 = (self.df['Close'].iloc[previous_candle] - self.df['Close'].iloc[filtered_pl_index[x]]) / (previous_candle - filtered_pl_index[x])
-                    virtual_line2 = self.df['Low'].iloc[previous_candle] - slope2
-                    arrived = True
-                    for y in range(virtual_line_start, filtered_pl_index[x] + 1, -1):
-                        if self.df['RSI'].iloc[y] < virtual_line1 or self.df['Close'].iloc[y] < virtual_line2:
-                            arrived = False
-                            break
-                        virtual_line1 -= slope1
-                        virtual_line2 -= slope2
-
-        return arrived
-
-    def bear_hidden_divergences(self, candleid, ph_index):
-        arrived = False
-        previous_candle = candleid - self.trigger_candle
-        array_filter = ph_index < previous_candle
-        filtered_ph_index = ph_index[array_filter]
-        end = min(self.max_pivot + 1, len(filtered_ph_index) + 1)
-        virtual_line_start = previous_candle - 1
-        if self.df['RSI'].iloc[candleid] < self.df['RSI'].iloc[previous_candle] or self.df['Close'].iloc[candleid] < self.df['Close'].iloc[previous_candle]:
-            for x in range(-1, -end, -1):
-                lenght = candleid - filtered_ph_index[x] + self.pivot_period
-                if filtered_ph_index[x] == 0 or lenght > self.div_max_candles:
-                    continue
-                if lenght > 5 and \
-                        self.df['RSI'].iloc[previous_candle] > self.df['RSI'].iloc[filtered_ph_index[x]] and self.df['Close'].iloc[previous_candle] < self.df['Close'].iloc[filtered_ph_index[x]]:
-                    slope1 = (self.df['RSI'].iloc[previous_candle] - self.df['RSI'].iloc[filtered_ph_index[x]]) / (previous_candle - filtered_ph_index[x])
-                    virtual_line1 = self.df['RSI'].iloc[previous_candle] - slope1
-                    slope2 = (self.df['Close'].iloc[previous_candle] - self.df['Close'].iloc[filtered_ph_index[x]]) / (previous_candle - filtered_ph_index[x])
-                    virtual_line2 = self.df['High'].iloc[previous_candle] - slope2
-                    arrived = True
-                    for y in range(virtual_line_start, filtered_ph_index[x] + 1, -1):
-                        if self.df['RSI'].iloc[y] > virtual_line1 or self.df['Close'].iloc[y] > virtual_line2:
-                            arrived = False
-                            break
-                        virtual_line1 -= slope1
-                        virtual_line2 -= slope2
-
-        return arrived
-
-    def bear_regular_divergences(self, candleid, ph_index):
-        arrived = False
-        previous_candle = candleid - self.trigger_candle
-        array_filter = ph_index < previous_candle
-        filtered_ph_index = ph_index[array_filter]
-        end = min(self.max_pivot + 1, len(filtered_ph_index) + 1)
-        virtual_line_start = previous_candle - 1
-        if self.df['RSI'].iloc[candleid] < self.df['RSI'].iloc[previous_candle] or self.df['Close'].iloc[candleid] < self.df['Close'].iloc[previous_candle]:
-            for x in range(-1, -end, -1):
-                lenght = candleid - filtered_ph_index[x] + self.pivot_period
-                if filtered_ph_index[x] == 0 or lenght > self.div_max_candles:
-                    continue
-                if lenght > 5 and \
-                        self.df['RSI'].iloc[previous_candle] < self.df['RSI'].iloc[filtered_ph_index[x]] and self.df['Close'].iloc[previous_candle] > self.df['Close'].iloc[filtered_ph_index[x]]:
-                    slope1 = (self.df['RSI'].iloc[previous_candle] - self.df['RSI'].iloc[filtered_ph_index[x]]) / (previous_candle - filtered_ph_index[x])
-                    virtual_line1 = self.df['RSI'].iloc[previous_candle] - slope1
-                    slope2 = (self.df['Close'].iloc[previous_candle] - self.df['Close'].iloc[filtered_ph_index[x]]) / (previous_candle - filtered_ph_index[x])
-                    virtual_line2 = self.df['High'].iloc[previous_candle] - slope2
-                    arrived = True
-                    for y in range(virtual_line_start, filtered_ph_index[x] + 1, -1):
-                        if self.df['RSI'].iloc[y] > virtual_line1 or self.df['Close'].iloc[y] > virtual_line2:
-                            arrived = False
-                            break
-                        virtual_line1 -= slope1
-                        virtual_line2 -= slope2
-
-        return arrived
-
-    def _set_div_signal(self, x):
-        candleid = int(x.name)
-
-        pl_index = self.df.index[self.df["pivot"] == 1][-20:]
-        ph_index = self.df.index[self.df["pivot"] == 2][-20:]
-
-        if self.df['pivot'].iloc[candleid - self.trigger_candle] in (1, 2, -1, -2):
-            is_hidden_bull_div = self.bull_hidden_divergences(candleid, pl_index)
-            is_regular_bull_div = self.bull_regular_divergences(candleid, pl_index)
-            is_hidden_bear_div = self.bear_hidden_divergences(candleid, ph_index)
-            is_regular_bear_div = self.bear_regular_divergences(candleid, ph_index)
-
-            return 1 if is_hidden_bull_div else 2 if is_regular_bull_div else -1 if is_hidden_bear_div else -2 if is_regular_bear_div else 0
-        else:
-            return 0
+    def _set_div_signal(self):
+        engine = DivergenceEngine(self.df['RSI'], self.df['Close'], self.df['Low'], self.df['High'], self.df['pivot'], trigger_candle=self.trigger_candle,
+                                  pivot_period=self.pivot_period, max_pivot=self.max_pivot, max_candles=self.div_max_candles)
+
+        return engine.get_signals()
 
     def _has_divergence(self, div_sides, row_index, div_lookback_period):
         for index in range(row_index, row_index - div_lookback_period):
@@ -1,7 +1,11 @@
+import numpy as np
 import pandas as pd
 import talib
 
+from program.models.Divergence import DivergenceEngine
 from program.models.Strategies.Strategy import Strategy
+from program.models.Incremental import ForwardFill, Macd, ResampledEma, SteppedEma
+from program.models.Timeframes import get_origin, get_timedelta, stepped_ema
 
 class MtfEmaMacdDiv(Strategy):
     def __init__(self, symbol, timeframe, atr_multiplier=1.5, rr=2):
@@ -25,27 +29,40 @@ class MtfEmaMacdDiv(Strategy):
         self.div_max_candles = 100
 
     def set_indicators(self):
-        self.df.set_index('Open Time', inplace=True)
-        long_resample_df = self.df['Close'].resample(self.long_ema_tf).ffill()
-        short_resample_df = self.df['Close'].resample(self.short_ema_tf).ffill()
-
-        self.df['Long EMA'] = talib.EMA(long_resample_df, timeperiod=self.long_ema_period)
-        self.df['Short EMA'] = talib.EMA(short_resample_df, timeperiod=self.short_ema_period)
+        self.df['Long EMA'] = self.cached_indicator('Timeframe EMA', lambda: self._get_timeframe_ema(self.long_ema_tf, self.long_ema_period), self.long_ema_tf, self.long_ema_period)
+        self.df['Short EMA'] = self.cached_indicator('Timeframe EMA', lambda: self._get_timeframe_ema(self.short_ema_tf, self.short_ema_period), self.short_ema_tf, self.short_ema_period)
 
         self.df['Long EMA'] = self.df['Long EMA'].astype(float).ffill()
         self.df['Short EMA'] = self.df['Short EMA'].astype(float).ffill()
 
-        self.df['MACD Line'], self.df['MACD Signal'], self.df['MACD Histogram'] = talib.MACD(self.df['Close'], self.MACD_fast_period, self.MACD_slow_period, 9)
+        macd = self.cached_indicator('MACD', lambda: talib.MACD(self.df['Close'], self.MACD_fast_period, self.MACD_slow_period, 9), self.MACD_fast_period, self.MACD_slow_period, 9)
+        self.df['MACD Line'], self.df['MACD Signal'], self.df['MACD Histogram'] = macd
 
-        self.df.reset_index(inplace=True)
         self.df = self.df.loc[self.df.notnull().all(axis=1).argmax():]
         self.df.reset_index(inplace=True)
 
-        self.df['pivot'] = self.df.apply(lambda x: self._set_pivot_points(self.df, x.name, self.pivot_period, self.pivot_period), axis=1)
-        self.df['divSignal'] = self.df.apply(lambda row: self._set_div_signal(row), axis=1)
+        self.df['pivot'] = self.cached_indicator('Pivots', lambda: self.pivot_points('Close', self.pivot_period, self.pivot_period), 'Close', self.pivot_period, self.pivot_period)
+        self.df['divSignal'] = self.cached_indicator('MACD Divergence', self._set_div_signal, self.MACD_fast_period, self.MACD_slow_period, 9, self.trigger_candle, self.pivot_period,
+                                                     self.max_pivot, self.div_max_candles, self.zero_line)
+
+    def get_incremental_indicators(self):
+        # Pivots and divergences are only known pivot_period candles after the pivot, they stay with the batch indicators
+        long_ema = self._get_incremental_timeframe_ema(self.long_ema_tf, self.long_ema_period)
+        short_ema = self._get_incremental_timeframe_ema(self.short_ema_tf, self.short_ema_period)
+        filled_long_ema, filled_short_ema = ForwardFill(), ForwardFill()
+        macd = Macd(self.MACD_fast_period, self.MACD_slow_period, 9)
+
+        return {
+            'Long EMA': lambda row: filled_long_ema.update(long_ema.update(row['Close'], pd.Timestamp(row['Open Time']).value)),
+            'Short EMA': lambda row: filled_short_ema.update(short_ema.update(row['Close'], pd.Timestamp(row['Open Time']).value)),
+            ('MACD Line', 'MACD Signal', 'MACD Histogram'): lambda row: macd.update(row['Close'])
+        }
 
-    def _get_side(self, row):
-        return 1 if float(row['Long EMA']) < float(row['Short EMA']) else -1 if float(row['Long EMA']) > float(row['Short EMA']) else 0
+    def _get_side(self):
+        short_ema = self.df['Short EMA'].to_numpy(dtype=float)
+        long_ema = self.df['Long EMA'].to_numpy(dtype=float)
+
+        return np.select([long_ema < short_ema, long_ema > short_ema], [1, -1], 0).astype(np.int8)
 
     def set_exit_signals(self, open_trade, index, row):
         if row['Has Open Position']:
@@ -78,17 +95,15 @@ class MtfEmaMacdDiv(Strategy):
         prev_index = row.name - 1 if row.name > 0 else 0
 
         # Todo: Look at the charts and use ATR OR Swing High/Low, not both
-        max_values = self.df['High'].rolling(self.swing_lockback_period).max()
-        min_values = self.df['Low'].rolling(self.swing_lockback_period).min()
 
         if bool(self.df['SL Price'].iloc[prev_index]):
             return float(self.df['SL Price'].iloc[prev_index])
         else:
             if row['Enter']:
                 if row['Side'] == 1:
-                    return float(min_values.iloc[row.name] * 0.99)
+                    return float(self.levels['Swing Low'][row.name] * 0.99)
                 else:
-                    return float(max_values.iloc[row.name] * 1.01)
+                    return float(self.levels['Swing High'][row.name] * 1.01)
             else:
                 return 0
 
@@ -106,163 +121,25 @@ class MtfEmaMacdDiv(Strategy):
             else:
                 return 0
 
-    def _set_pivot_points(self, df, l, n1, n2):  # n1 n2 before and after candle l
-        if l - n1 < 0 or l + n2 >= len(df):
-            return 0
-
-        pividlow = 1
-        pividhigh = 1
-        for i in range(l - n1, l + n2 + 1):
-            if (df['Close'].iloc[l] > df['Close'].iloc[i]):
-                pividlow = 0
-            if (df['Close'].iloc[l] < df['Close'].iloc[i]):
-                pividhigh = 0
-        if pividlow and pividhigh:
-            return 3
-        elif pividlow:
-            return 1
-        elif pividhigh:
-            return 2
-        else:
-            return 0
-
-    def bull_hidden_divergences(self, candleid, pl_index):
-        arrived = False
-        previous_candle = candleid - self.trigger_candle
-        array_filter = pl_index < previous_candle
-        filtered_pl_index = pl_index[array_filter]
-        end = min(self.max_pivot + 1, len(filtered_pl_index) + 1)
-        virtual_line_start = previous_candle - 1
-        if self.df['MACD Line'].iloc[candleid] > self.df['MACD Line'].iloc[previous_candle] or self.df['Close'].iloc[candleid] > self.df['Close'].iloc[previous_candle]:
-            for x in range(-1, -end, -1):
-                lenght = candleid - filtered_pl_index[x] + self.pivot_period
-                if filtered_pl_index[x] == 0 or lenght > self.div_max_candles:
-                    continue
-                if lenght > 5 and \
-                        self.df['MACD Line'].iloc[previous_candle] < self.df['MACD Line'].iloc[filtered_pl_index[x]] and \
-                        self.df['Close'].iloc[previous_candle] > self.df['Close'].iloc[filtered_pl_index[x]] and \
-                        self.df['MACD Line'].iloc[previous_candle] < self.zero_line and \
-                        self.df['MACD Line'].iloc[filtered_pl_index[x]] < self.zero_line:
-                    slope1 = (self.df['MACD Line'].iloc[previous_candle] - self.df['MACD Line'].iloc[filtered_pl_index[x]]) / (previous_candle - filtered_pl_index[x])
-                    virtual_line1 = self.df['MACD Line'].iloc[previous_candle] - slope1
-                    slope2 = (self.df['Close'].iloc[previous_candle] - self.df['Close'].iloc[filtered_pl_index[x]]) / (previous_candle - filtered_pl_index[x])
-                    virtual_line2 = self.df['Low'].iloc[previous_candle] - slope2
-                    arrived = True
-                    for y in range(virtual_line_start, filtered_pl_index[x] + 1, -1):
-                        if self.df['MACD Line'].iloc[y] < virtual_line1 or self.df['Close'].iloc[y] < virtual_line2:
-                            arrived = False
-                            break
-                        virtual_line1 -= slope1
-                        virtual_line2 -= slope2
+    def _get_timeframe_ema(self, tf, period):
+        # A tf shorter than the candles can't be built from them, the close then counts once per tf step it spans.
+        # A longer tf is aggregated from the candles and every candle gets the EMA of the last completed tf candle.
+        if get_timedelta(tf) < get_timedelta(self.tf):
+            return stepped_ema(self.df['Close'], self.df['Open Time'], tf, period)
 
-        return arrived
+        return self.timeframes.get_indicator(self.symbol, self.tf, self.df, tf, lambda candles: talib.EMA(candles['Close'], timeperiod=period))
 
-    def bull_regular_divergences(self, candleid, pl_index):
-        arrived = False
-        previous_candle = candleid - self.trigger_candle
-        array_filter = pl_index < previous_candle
-        filtered_pl_index = pl_index[array_filter]
-        end = min(self.max_pivot + 1, len(filtered_pl_index) + 1)
-        virtual_line_start = previous_candle - 1
+    def _get_incremental_timeframe_ema(self, tf, period):
+        # _get_timeframe_ema one candle at a time
+        step = get_timedelta(tf).value
+        candle_step = get_timedelta(self.tf).value
+        if step < candle_step:
+            return SteppedEma(period, step)
 
-        if self.df['MACD Line'].iloc[candleid] > self.df['MACD Line'].iloc[previous_candle] or self.df['Close'].iloc[candleid] > self.df['Close'].iloc[previous_candle]:
-            for x in range(-1, -end, -1):
-                lenght = candleid - filtered_pl_index[x] + self.pivot_period
-                if filtered_pl_index[x] == 0 or lenght > self.div_max_candles:
-                    continue
-                if lenght > 5 and \
-                        self.df['MACD Line'].iloc[previous_candle] > self.df['MACD Line'].iloc[filtered_pl_index[x]] and \
-                        self.df['Close'].iloc[previous_candle] < self.df['Close'].iloc[filtered_pl_index[x]] and \
-                        self.df['MACD Line'].iloc[previous_candle] < self.zero_line and \
-                        self.df['MACD Line'].iloc[filtered_pl_index[x]] < self.zero_line:
-                    slope1 = (self.df['MACD Line'].iloc[previous_candle] - self.df['MACD Line'].iloc[filtered_pl_index[x]]) / (previous_candle - filtered_pl_index[x])
-                    virtual_line1 = self.df['MACD Line'].iloc[previous_candle] - slope1
-                    slope2 = (self.df['Close'].iloc[previous_candle] - self.df['Close'].iloc[filtered_pl_index[x]]) / (previous_candle - filtered_pl_index[x])
-                    virtual_line2 = self.df['Low'].iloc[previous_candle] - slope2
-                    arrived = True
-                    for y in range(virtual_line_start, filtered_pl_index[x] + 1, -1):
-                        if self.df['MACD Line'].iloc[y] < virtual_line1 or self.df['Close'].iloc[y] < virtual_line2:
-                            arrived = False
-                            break
-                        virtual_line1 -= slope1
-                        virtual_line2 -= slope2
+        return ResampledEma(period, step, candle_step, get_origin(step))
 
-        return arrived
+    def _set_div_signal(self):
+        engine = DivergenceEngine(self.df['MACD Line'], self.df['Close'], self.df['Low'], self.df['High'], self.df['pivot'], trigger_candle=self.trigger_candle,
+                                  pivot_period=self.pivot_period, max_pivot=self.max_pivot, max_candles=self.div_max_candles, zero_line=self.zero_line)
 
-    def bear_hidden_divergences(self, candleid, ph_index):
-        arrived = False
-        previous_candle = candleid - self.trigger_candle
-        array_filter = ph_index < previous_candle
-        filtered_ph_index = ph_index[array_filter]
-        end = min(self.max_pivot + 1, len(filtered_ph_index) + 1)
-        virtual_line_start = previous_candle - 1
-        if self.df['MACD Line'].iloc[candleid] < self.df['MACD Line'].iloc[previous_candle] or self.df['Close'].iloc[candleid] < self.df['Close'].iloc[previous_candle]:
-            for x in range(-1, -end, -1):
-                lenght = candleid - filtered_ph_index[x] + self.pivot_period
-                if filtered_ph_index[x] == 0 or lenght > self.div_max_candles:
-                    continue
-                if lenght > 5 and \
-                        self.df['MACD Line'].iloc[previous_candle] > self.df['MACD Line'].iloc[filtered_ph_index[x]] and \
-                        self.df['Close'].iloc[previous_candle] < self.df['Close'].iloc[filtered_ph_index[x]] and \
-                        self.df['MACD Line'].iloc[previous_candle] > self.zero_line and \
-                        self.df['MACD Line'].iloc[filtered_ph_index[x]] > self.zero_line:
-                    slope1 = (self.df['MACD Line'].iloc[previous_candle] - self.df['MACD Line'].iloc[filtered_ph_index[x]]) / (previous_candle - filtered_ph_index[x])
-                    virtual_line1 = self.df['MACD Line'].iloc[previous_candle] - slope1
-                    slope2 = (self.df['Close'].iloc[previous_candle] - self.df['Close'].iloc[filtered_ph_index[x]]) / (previous_candle - filtered_ph_index[x])
-                    virtual_line2 = self.df['High'].iloc[previous_candle] - slope2
-                    arrived = True
-                    for y in range(virtual_line_start, filtered_ph_index[x] + 1, -1):
-                        if self.df['MACD Line'].iloc[y] > virtual_line1 or self.df['Close'].iloc[y] > virtual_line2:
-                            arrived = False
-                            break
-                        virtual_line1 -= slope1
-                        virtual_line2 -= slope2
-
-        return arrived
-
-    def bear_regular_divergences(self, candleid, ph_index):
-        arrived = False
-        previous_candle = candleid - self.trigger_candle
-        array_filter = ph_index < previous_candle
-        filtered_ph_index = ph_index[array_filter]
-        end = min(self.max_pivot + 1, len(filtered_ph_index) + 1)
-        virtual_line_start = previous_candle - 1
-        if self.df['MACD Line'].iloc[candleid] < self.df['MACD Line'].iloc[previous_candle] or self.df['Close'].iloc[candleid] < self.df['Close'].iloc[previous_candle]:
-            for x in range(-1, -end, -1):
-                lenght = candleid - filtered_ph_index[x] + self.pivot_period
-                if filtered_ph_index[x] == 0 or lenght > self.div_max_candles:
-                    continue
-                if lenght > 5 and \
-                        self.df['MACD Line'].iloc[previous_candle] < self.df['MACD Line'].iloc[filtered_ph_index[x]] and \
-                        self.df['Close'].iloc[previous_candle] > self.df['Close'].iloc[filtered_ph_index[x]] and \
-                        self.df['MACD Line'].iloc[previous_candle] > self.zero_line and \
-                        self.df['MACD Line'].iloc[filtered_ph_index[x]] > self.zero_line:
-                    slope1 = (self.df['MACD Line'].iloc[previous_candle] - self.df['MACD Line'].iloc[filtered_ph_index[x]]) / (previous_candle - filtered_ph_index[x])
-                    virtual_line1 = self.df['MACD Line'].iloc[previous_candle] - slope1
-                    slope2 = (self.df['Close'].iloc[previous_candle] - self.df['Close'].iloc[filtered_ph_index[x]]) / (previous_candle - filtered_ph_index[x])
-                    virtual_line2 = self.df['High'].iloc[previous_candle] - slope2
-                    arrived = True
-                    for y in range(virtual_line_start, filtered_ph_index[x] + 1, -1):
-                        if self.df['MACD Line'].iloc[y] > virtual_line1 or self.df['Close'].iloc[y] > virtual_line2:
-                            arrived = False
-                            break
-                        virtual_line1 -= slope1
-                        virtual_line2 -= slope2
-
-        return arrived
-
-    def _set_div_signal(self, x):
-        candleid = int(x.name)
-
-        pl_index = self.df.index[self.df["pivot"] == 1][-20:]
-        ph_index = self.df.index[self.df["pivot"] == 2][-20:]
-
-        if self.df['pivot'].iloc[candleid - self.trigger_candle] in (1, 2, -1, -2):
-            is_hidden_bull_div = self.bull_hidden_divergences(candleid, pl_index)
-            is_regular_bull_div = self.bull_regular_divergences(candleid, pl_index)
-            is_hidden_bear_div = self.bear_hidden_divergences(candleid, ph_index)
-            is_regular_bear_div = self.bear_regular_divergences(candleid, ph_index)
-
-            return 1 if is_hidden_bull_div else 2 if is_regular_bull_div else -1 if is_hidden_bear_div else -2 if is_regular_bear_div else 0
-        else:
-            return 0
+        return engine.get_signals()
@@ -1,13 +1,27 @@
+import copy
 import os
 from pathlib import Path
 
 import pandas as pd
 import numpy as np
 import talib as talib
+from numpy.lib.stride_tricks import sliding_window_view
 from dotenv import load_dotenv
 
+from program.models.CandleCache import CandleCache
+from program.models.CandleStore import CandleStore
+from program.models.IndicatorCache import IndicatorCache
+from program.models.Timeframes import TimeframeService, get_timedelta, resample_candles
+
 
 class Strategy:
+    # Set in sweep worker processes: candles are read from the memory mapped CandleStore shared by all workers
+    shared_candles = False
+    # On disk cache of indicator values shared by every strategy in the process, set INDICATOR_CACHE=0 to always compute them
+    indicator_cache = IndicatorCache()
+    # Candles of higher timeframes derived from the candles of a strategy, shared by every strategy in the process
+    timeframes = TimeframeService()
+
     def __init__(self, symbol, timeframe, atr_multiplier=1.5, rr=2):
         load_dotenv()
 
@@ -21,11 +35,125 @@ class Strategy:
 
         self.risk_reward = rr
 
-        self.df = self._get_candle_data()
+        # Lookback of the swing highs and lows stop losses are placed around
+        self.swing_lockback_period = 10
+        # Swing highs/lows and ATR bands of the current run, set by set_levels
+        self.levels = {}
+
+        # Vectorized strategies set whole Side/Enter/SL Price/TP Price columns in set_signals
+        self.vectorized = False
+        # Stateful strategies implement on_bar over the NumPy columns of a BarState instead of the row hooks
+        self.array_backed = False
+        # Column with the ATR distance of a trailing stop loss, vectorized strategies with a trailing stop set it
+        self.trailing_stop = None
+
+        # Set once the parameter independent indicators (and signals) are in the dataframe
+        self.indicators_set = False
+        # Off for frames whose indicators are used once, like the chunks of a streaming run, so they don't fill the cache
+        self.cache_indicators = True
+
+        # Candles before a chunk of a streaming run its indicators are computed over, enough for every indicator to settle
+        self.warmup_candles = 1000
+
+        # read on first use, a streaming run never holds all candles at once
+        self._df = None
+
+        # Incremental indicators of a forward test, built on the first update
+        self.incremental_indicators = None
+
+    @property
+    def df(self):
+        if self._df is None:
+            self._df = self._get_candle_data()
+
+        return self._df
+
+    @df.setter
+    def df(self, df):
+        self._df = df
 
     def set_indicators(self):
         raise NotImplementedError()
 
+    def set_signals(self):
+        raise NotImplementedError()
+
+    def set_stops(self):
+        raise NotImplementedError()
+
+    def set_risk_columns(self):
+        # Columns that depend on risk_reward or atr_multiplier, recomputed for every grid point of a sweep
+        pass
+
+    def get_incremental_indicators(self):
+        # Constant time versions of the indicators of set_indicators for update: a dict from a column (or a tuple of
+        # columns) to a function of the row of the new candle returning its value(s), in the order they are computed.
+        raise NotImplementedError()
+
+    def update(self, candle):
+        # Forward testing entry point: the indicator columns of one new closed candle (a dict or Series with at least
+        # Open, High, Low and Close), the values set_indicators gives that candle without recomputing the older ones.
+        if self.incremental_indicators is None:
+            self.incremental_indicators = self.get_incremental_indicators()
+
+        row = dict(candle)
+        for columns, compute in self.incremental_indicators.items():
+            values = compute(row)
+            if isinstance(columns, tuple):
+                row.update(zip(columns, values))
+            else:
+                row[columns] = values
+
+        return row
+
+    def set_shared_indicators(self, signals=False):
+        self.set_indicators()
+        if signals:
+            self.set_signals()
+
+        self.indicators_set = True
+
+    def load_indicators(self, signals=False):
+        if not self.indicators_set:
+            self.set_shared_indicators(signals)
+
+        self.set_risk_columns()
+
+    def with_parameters(self, rr, atr_multiplier):
+        # Copy of the strategy that reuses the indicators computed so far for another rr/atr combination
+        strategy = copy.copy(self)
+        strategy.df = self.df.copy()
+        strategy.risk_reward = rr
+        strategy.atr_multiplier = atr_multiplier
+
+        return strategy
+
+    def set_levels(self):
+        # Computed once per run over the candles of the run, the stop loss and take profit hooks only look values up by index
+        swing_high = self.df['High'].rolling(self.swing_lockback_period).max().to_numpy()
+        swing_low = self.df['Low'].rolling(self.swing_lockback_period).min().to_numpy()
+
+        self.levels = {'Swing High': swing_high, 'Swing Low': swing_low}
+        if 'ATR' in self.df:
+            atr = self._get_atr_distance()
+            self.levels['Upper ATR Band'] = swing_high + atr
+            self.levels['Lower ATR Band'] = swing_low - atr
+
+    def _get_atr_distance(self):
+        return self.df['ATR'].to_numpy() * self.atr_multiplier
+
+    def cached_indicator(self, name, compute, *params):
+        # Values of compute() for the candles currently in df, params has to hold everything the result depends on
+        if not self.cache_indicators:
+            return self.indicator_cache.compute(compute)
+
+        prices = self.df[['Open', 'High', 'Low', 'Close', 'Volume']].to_numpy(dtype=float)
+
+        return self.indicator_cache.get(self.symbol, self.tf, prices, name, params, compute)
+
+    def on_bar(self, index, state):
+        raise NotImplementedError()
+
     def set_basic_columns(self, index, row):
         row['Has Open Position'] = self._has_open_position(index)
         row['SL Price'] = self.df['SL Price'].iloc[index - 1 if index > 0 else 0]
@@ -39,27 +167,23 @@ class Strategy:
         self.df.iloc[index] = row
 
     def set_columns(self):
-        self.df = self.df.append({
-            'Side': 0,
-            'Enter': 0,
-            'Has Open Position': 0,
-            'Entry Price': 0,
-            'SL Price': 0,
-            'TP Price': 0,
-            'Exit': 0,
-            'Exit Price': 0,
-            'Equity': 0
-        }, ignore_index=True)
-
-        self.df['Exit'] = self.df['Exit'].fillna(0).astype(int)
-        self.df['Enter'] = self.df['Enter'].fillna(0).astype(int)
-        self.df['Has Open Position'] = self.df['Has Open Position'].fillna(0).astype(int)
-        self.df['Entry Price'] = self.df['Entry Price'].fillna(0.0).astype(float)
-        self.df['SL Price'] = self.df['SL Price'].fillna(0.0).astype(float)
-        self.df['TP Price'] = self.df['TP Price'].fillna(0.0).astype(float)
-        self.df['Exit Price'] = self.df['Exit Price'].fillna(0.0).astype(float)
-        self.df['Equity'] = self.df['Equity'].fillna(0.0).astype(float)
-        self.df['Side'] = self.df.apply(lambda row: self._get_side(row), axis=1).fillna(0).astype(int)
+        # Bookkeeping columns of the row and bar loops, allocated in one step next to the indicators
+        self.df = self.df.reset_index(drop=True)
+        length = len(self.df)
+
+        columns = pd.DataFrame({
+            'Side': self._get_side(),
+            'Enter': np.zeros(length, dtype=int),
+            'Has Open Position': np.zeros(length, dtype=int),
+            'Entry Price': np.zeros(length),
+            'SL Price': np.zeros(length),
+            'TP Price': np.zeros(length),
+            'Exit': np.zeros(length, dtype=int),
+            'Exit Price': np.zeros(length),
+            'Equity': np.zeros(length)
+        })
+
+        self.df = pd.concat([self.df.drop(columns=columns.columns, errors='ignore'), columns], axis=1)
 
     def set_entry_signals(self, index, row):
         row['Enter'] = self._enter_trade(row)
@@ -95,16 +219,108 @@ class Strategy:
         self.df.iloc[index] = row
 
     def _get_candle_data(self):
-        path = Path(__file__).parent.parent.parent.parent / f'Historical_Data/{self.symbol}_{self.tf}.csv'
-        df = pd.read_csv(path)
-        df = df[df['Volume'] != 0]
-        df.dropna(inplace=True)
-        df.reset_index(drop=True, inplace=True)
+        base_tf = self._get_base_timeframe()
+        path = self._get_candle_path(base_tf or self.tf)
+
+        if self.shared_candles:
+            store = CandleStore()
+            name = self._get_candle_name(self.tf, base_tf)
+            df = store.open(path, name)
+            if df is None:
+                df = self._read_candle_data(path, self.tf, base_tf)
+                shared_df = store.open(path, name) if store.build(path, df, name) else None
+                df = df if shared_df is None else shared_df
+
+            return df
+
+        return self._read_candle_data(path, self.tf, base_tf)
+
+    def _read_candle_data(self, path, tf, base_tf=None):
+        # The cleaned and typed candles are cached in a binary file next to the csv, set CANDLE_CACHE=0 to always parse the csv.
+        # With a base_tf the candles of tf are aggregated from the (cached) candles of base_tf in path.
+        use_cache = os.getenv('CANDLE_CACHE', '1') != '0'
+        name = self._get_candle_name(tf, base_tf)
+        if use_cache:
+            df = CandleCache().load(path, name)
+            if df is not None:
+                return df
 
-        df = self._set_types(df)
+        if base_tf is None:
+            df = self._clean_candle_data(pd.read_csv(path))
+        else:
+            base_df = self._read_candle_data(path, base_tf)
+            df = self.timeframes.get_candles(self.symbol, base_tf, base_df, tf).drop(columns='Last Open Time')
+
+        if use_cache:
+            CandleCache().save(path, df, name)
 
         return df
 
+    def iter_candle_chunks(self, chunk_size):
+        # The candles in chunks of chunk_size csv rows, read one chunk at a time.
+        # Aggregated candles are only yielded once complete, the candles of the last bin wait for the next chunk.
+        base_tf = self._get_base_timeframe()
+        carry = None
+
+        for chunk in pd.read_csv(self._get_candle_path(base_tf or self.tf), chunksize=chunk_size):
+            df = self._clean_candle_data(chunk)
+            if base_tf is None:
+                if len(df):
+                    yield df
+                continue
+
+            if carry is not None:
+                df = pd.concat([carry, df], ignore_index=True)
+            if not len(df):
+                continue
+
+            candles = resample_candles(df, self.tf)
+            carry = df[df['Open Time'] >= candles['Open Time'].iloc[-1]]
+            if len(candles) > 1:
+                yield candles.iloc[:-1].drop(columns='Last Open Time')
+
+        if carry is not None and len(carry):
+            yield resample_candles(carry, self.tf).drop(columns='Last Open Time')
+
+    def _clean_candle_data(self, df):
+        df = df[df['Volume'] != 0]
+        df = df.dropna()
+        df = df.reset_index(drop=True)
+
+        return self._set_types(df)
+
+    def _get_base_timeframe(self):
+        # Timeframe the candles get aggregated from, None when they are read from their own csv.
+        # BASE_TIMEFRAME keeps one resolution per symbol and derives every timeframe it divides from it. Without it
+        # only a timeframe without a csv is derived, from the longest timeframe with a csv that divides it.
+        base_tf = os.getenv('BASE_TIMEFRAME')
+        if base_tf:
+            return base_tf if self._divides(base_tf, self.tf) else None
+
+        if self._get_candle_path(self.tf).is_file():
+            return None
+
+        base_tfs = [path.stem[len(self.symbol) + 1:] for path in self._get_candle_path('*').parent.glob(f'{self.symbol}_*.csv')]
+        base_tfs = [tf for tf in base_tfs if self._divides(tf, self.tf)]
+
+        return max(base_tfs, key=get_timedelta) if base_tfs else None
+
+    def _get_candle_name(self, tf, base_tf=None):
+        # Candles aggregated from another timeframe never share a cache entry with the ones read from their own csv
+        return f'{self.symbol}_{tf}' if base_tf is None else f'{self.symbol}_{tf}_from_{base_tf}'
+
+    def _get_candle_path(self, tf):
+        return Path(__file__).parent.parent.parent.parent / f'Historical_Data/{self.symbol}_{tf}.csv'
+
+    def _divides(self, base_tf, tf):
+        # True when candles of tf are made of whole candles of the shorter base_tf
+        try:
+            base_step, step = get_timedelta(base_tf), get_timedelta(tf)
+        except ValueError:
+            return False
+
+        return base_step < step and step % base_step == pd.Timedelta(0)
+
     def _set_types(self, df):
         df['Open'] = df['Open'].astype(float)
         df['High'] = df['High'].astype(float)
@@ -123,7 +339,8 @@ class Strategy:
         else:
             return int(self.df['Enter'].iloc[prev_index] or 0)
 
-    def _get_side(self, row):
+    def _get_side(self):
+        # Side of every candle as an int8 column: 1 long, -1 short, 0 neither
         raise NotImplementedError()
 
     def _enter_trade(self, row):
@@ -140,4 +357,59 @@ class Strategy:
 
     def crossover(self, index, param1, param2):
         # Return true if param1 crosses over param2
-        return True if self.df[param1].iloc[index - 1] < self.df[param2].iloc[index - 1] and self.df[param1].iloc[index] > self.df[param2].iloc[index] else False
\ No newline at end of file
+        return True if self.df[param1].iloc[index - 1] < self.df[param2].iloc[index - 1] and self.df[param1].iloc[index] > self.df[param2].iloc[index] else False
+
+    def crossovers(self, column1, column2):
+        # Column version of crossover: column1 was below column2 on the previous candle and is above it now
+        values1 = self.df[column1].to_numpy(dtype=float)
+        values2 = self.df[column2].to_numpy(dtype=float)
+
+        return (self._shift(values1) < self._shift(values2)) & (values1 > values2)
+
+    def crossunders(self, column1, column2):
+        # column1 was above column2 on the previous candle and is below it now
+        return self.crossovers(column2, column1)
+
+    def zero_crosses(self, column, side, zero_line=0):
+        # Crosses of column over zero_line on long candles (side 1) and under it on short candles (side -1)
+        values = self.df[column].to_numpy(dtype=float)
+        previous = self._shift(values)
+
+        return np.where(side == 1, (previous < zero_line) & (zero_line < values), (side == -1) & (previous > zero_line) & (zero_line > values))
+
+    def pullbacks(self, side, period):
+        # Candles in a trend where, within the previous period candles, the first candle in that trend
+        # comes before the last neutral candle: the trend pulled back and resumed
+        index = np.arange(len(side))
+        window_start = index - period
+
+        last_neutral = np.maximum.accumulate(np.where(side == 0, index, -1))
+        last_neutral = np.r_[-1, last_neutral[:-1]]
+
+        pullbacks = np.zeros(len(side), dtype=bool)
+        for trend in (1, -1):
+            first_trend = np.minimum.accumulate(np.where(side == trend, index, len(side))[::-1])[::-1]
+            first_trend = first_trend[np.clip(window_start, 0, None)]
+            pullbacks |= (side == trend) & (window_start >= 0) & (first_trend < index) & (last_neutral >= window_start) & (first_trend < last_neutral)
+
+        return pullbacks
+
+    def _shift(self, values):
+        # values of the previous candle, NaN for the first one
+        return np.r_[np.nan, values[:-1]]
+
+    def pivot_points(self, column, left, right):
+        # 1 = pivot low, 2 = pivot high, 3 = flat window (both), 0 = no pivot or not enough candles around it
+        values = self.df[column].to_numpy(dtype=float)
+        pivots = np.zeros(len(values), dtype=int)
+        if len(values) < left + right + 1:
+            return pivots
+
+        windows = sliding_window_view(values, left + right + 1)
+        centre = values[left:len(values) - right, None]
+        is_low = ~(centre > windows).any(axis=1)
+        is_high = ~(centre < windows).any(axis=1)
+
+        pivots[left:len(values) - right] = np.select([is_low & is_high, is_low, is_high], [3, 1, 2], 0)
+
+        return pivots
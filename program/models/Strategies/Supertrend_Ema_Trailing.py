@@ -2,6 +2,8 @@ import pandas as pd
 import numpy as np
 import talib
 
+from program.models.Kernels import supertrend
+from program.models.Incremental import Atr, Ema, Supertrend
 from program.models.Strategies.Strategy import Strategy
 
 
@@ -17,19 +19,61 @@ class SupertrendEmaTrailing(Strategy):
         self.supertrend_period = 10
         self.supertrend_multiplier = 3
 
+        self.vectorized = True
+        self.array_backed = True
+        self.trailing_stop = 'ATR'
+
     def set_indicators(self):
         self.df = self.df.loc[self.df.notnull().all(axis=1).argmax():]
         self.df.reset_index(inplace=True)
 
-        self.df['EMA'] = talib.EMA(self.df['Close'], timeperiod=self.ema_period).astype(float).ffill()
-        self.df['ATR'] = talib.ATR(self.df['High'], self.df['Low'], self.df['Close'], timeperiod=self.atr_period).astype(float).ffill() * self.atr_multiplier
-        self.df = self.df.join(self._set_supertrend())
+        self.df['EMA'] = self.cached_indicator('EMA', lambda: talib.EMA(self.df['Close'], timeperiod=self.ema_period).astype(float).ffill(), self.ema_period)
+        self.df['Raw ATR'] = self.cached_indicator('ATR', lambda: talib.ATR(self.df['High'], self.df['Low'], self.df['Close'], timeperiod=self.atr_period).astype(float).ffill(), self.atr_period)
+        supertrend_values = self.cached_indicator('Supertrend', self._set_supertrend, self.supertrend_period, self.supertrend_multiplier)
+        self.df['Supertrend'], self.df['Final Lowerband'], self.df['Final Upperband'] = supertrend_values
 
         # remove first X NaN rows
         self.df = self.df.loc[199:]
 
-    def _get_side(self, row):
-        return 1 if float(row['Close']) > float(row['EMA']) else -1 if float(row['EMA']) > float(row['Close']) else 0
+    def get_incremental_indicators(self):
+        ema = Ema(self.ema_period)
+        atr = Atr(self.atr_period)
+        supertrend = Supertrend(self.supertrend_period, self.supertrend_multiplier)
+
+        return {
+            'EMA': lambda row: ema.update(row['Close']),
+            'Raw ATR': lambda row: atr.update(row['High'], row['Low'], row['Close']),
+            ('Supertrend', 'Final Lowerband', 'Final Upperband'): lambda row: supertrend.update(row['High'], row['Low'], row['Close'])
+        }
+
+    def set_risk_columns(self):
+        self.df['ATR'] = self.df['Raw ATR'] * self.atr_multiplier
+
+    def _get_atr_distance(self):
+        # the ATR column already includes the multiplier
+        return self.df['ATR'].to_numpy()
+
+    def set_signals(self):
+        side = self._get_side()
+        supertrend = self.df['Supertrend'].to_numpy(dtype=bool)
+
+        self.df['Side'] = side
+        self.df['Enter'] = np.where(side == 1, supertrend, ~supertrend).astype(int)
+
+    def set_stops(self):
+        # Stop loss at entry, the simulator trails it with the ATR column afterwards
+        close = self.df['Close'].to_numpy()
+        enter = self.df['Enter'].to_numpy() == 1
+        stop_loss = np.where(self.df['Side'] == 1, self.df['Low'] - self.df['ATR'], self.df['High'] + self.df['ATR'])
+
+        self.df['SL Price'] = np.where(enter, stop_loss, 0.0)
+        self.df['TP Price'] = np.where(enter, close + self.risk_reward * (close - stop_loss), 0.0)
+
+    def _get_side(self):
+        close = self.df['Close'].to_numpy(dtype=float)
+        ema = self.df['EMA'].to_numpy(dtype=float)
+
+        return np.select([close > ema, ema > close], [1, -1], 0).astype(np.int8)
 
     def set_exit_signals(self, open_trade, index, row):
         if row['Has Open Position']:
@@ -60,6 +104,43 @@ class SupertrendEmaTrailing(Strategy):
 
         self.df.iloc[index] = row
 
+    def on_bar(self, index, state):
+        if not state.in_position:
+            supertrend = state['Supertrend'][index]
+            is_long = state.side[index] == 1
+            enter = 1 if (is_long and supertrend) or (not is_long and not supertrend) else 0
+
+            state.enter[index] = enter
+            state.entry_price[index] = state.close[index] if enter else 0
+
+            if not state.sl_price[index] and enter:
+                state.sl_price[index] = self._get_trailing_stop(is_long, index, state)
+            if not state.tp_price[index] and enter:
+                state.tp_price[index] = state.close[index] + self.risk_reward * (state.close[index] - state.sl_price[index])
+        elif state.has_open_position[index]:
+            high = state.high[index]
+            low = state.low[index]
+            stop_loss = state.sl_price[index]
+            take_profit = state.tp_price[index]
+
+            if state.position_side == 1:
+                if high >= take_profit or low <= stop_loss:
+                    state.exit[index] = 1
+                    state.exit_price[index] = take_profit if high >= take_profit else stop_loss
+                else:
+                    state.sl_price[index] = self._get_trailing_stop(True, index, state)
+            else:
+                if high >= stop_loss or low <= take_profit:
+                    state.exit[index] = 1
+                    state.exit_price[index] = stop_loss if high >= stop_loss else take_profit
+                else:
+                    state.sl_price[index] = self._get_trailing_stop(False, index, state)
+
+            if state.exit[index]:
+                state.has_open_position[index] = 0
+                state.tp_price[index] = 0
+                state.sl_price[index] = 0
+
     def _enter_trade(self, row):
         if row['Side'] == 1:
             return 1 if bool(row['Supertrend']) else 0
@@ -100,6 +181,17 @@ class SupertrendEmaTrailing(Strategy):
         else:
             return float(row['High'] + row['ATR']) if not bool(row['SL Price']) else min(row['SL Price'], float(row['High'] + row['ATR']))
 
+    def _get_trailing_stop(self, is_long, index, state):
+        # Array version of _get_trailing_price
+        stop_loss = state.sl_price[index]
+
+        if is_long:
+            trailing_price = state.low[index] - state['ATR'][index]
+            return max(stop_loss, trailing_price) if stop_loss else trailing_price
+        else:
+            trailing_price = state.high[index] + state['ATR'][index]
+            return min(stop_loss, trailing_price) if stop_loss else trailing_price
+
     def _set_supertrend(self):
         high = self.df['High']
         low = self.df['Low']
@@ -122,36 +214,9 @@ class SupertrendEmaTrailing(Strategy):
         final_upperband = upperband = hl2 + (self.supertrend_multiplier * atr)
         final_lowerband = lowerband = hl2 - (self.supertrend_multiplier * atr)
 
-        # initialize Supertrend column to True
-        supertrend = [True] * len(self.df)
-
-        for i in range(1, len(self.df.index)):
-            curr, prev = i, i - 1
-
-            # if current close price crosses above upperband
-            if close[curr] > final_upperband[prev]:
-                supertrend[curr] = True
-            # if current close price crosses below lowerband
-            elif close[curr] < final_lowerband[prev]:
-                supertrend[curr] = False
-            # else, the trend continues
-            else:
-                supertrend[curr] = supertrend[prev]
-
-                # adjustment to the final bands
-                if supertrend[curr] == True and final_lowerband[curr] < final_lowerband[prev]:
-                    final_lowerband[curr] = final_lowerband[prev]
-                if supertrend[curr] == False and final_upperband[curr] > final_upperband[prev]:
-                    final_upperband[curr] = final_upperband[prev]
-
-            # to remove bands according to the trend direction
-            if supertrend[curr] == True:
-                final_upperband[curr] = np.nan
-            else:
-                final_lowerband[curr] = np.nan
+        # the trend starts True, the compiled kernel runs when Numba is installed
+        final_upperband = final_upperband.to_numpy(dtype=float, copy=True)
+        final_lowerband = final_lowerband.to_numpy(dtype=float, copy=True)
+        trend = supertrend(close.to_numpy(dtype=float), final_upperband, final_lowerband)
 
-        return pd.DataFrame({
-            'Supertrend': supertrend,
-            'Final Lowerband': final_lowerband,
-            'Final Upperband': final_upperband
-        }, index=self.df.index)
+        return trend, final_lowerband, final_upperband
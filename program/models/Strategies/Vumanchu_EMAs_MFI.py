@@ -1,6 +1,8 @@
+import numpy as np
 import pandas as pd
 import talib
 
+from program.models.Incremental import Atr, Cross, Ema, ForwardFill, MoneyFlow, Wavetrend
 from program.models.Strategies.Strategy import Strategy
 
 class VumanchuEmasMfi(Strategy):
@@ -25,22 +27,70 @@ class VumanchuEmasMfi(Strategy):
         self.swing_lockback_period = 10
         self.pullback_period = 15
 
+        self.vectorized = True
+
     def set_indicators(self):
         self.df = self.df.loc[self.df.notnull().all(axis=1).argmax():]
         self.df.reset_index(inplace=True)
 
-        self.df['Long EMA'] = talib.EMA(self.df['Close'], timeperiod=self.long_ema_period).astype(float).ffill()
-        self.df['Short EMA'] = talib.EMA(self.df['Close'], timeperiod=self.short_ema_period).astype(float).ffill()
-        self.df['ATR'] = talib.ATR(self.df['High'], self.df['Low'], self.df['Close'], timeperiod=self.atr_period).astype(float).ffill()
-        self.df['WT1'] = self._set_wavetrend(1).astype(float).ffill()
-        self.df['WT2'] = self._set_wavetrend(2).astype(float).ffill()
-        self.df['MFI'] = self._set_MFI().astype(float).ffill()
-
-        self.df['CrossUp'] = self.df.apply(lambda row: self.crossover(row.name, 'WT1', 'WT2'), axis=1).fillna(0).astype(int)
-        self.df['CrossDown'] = self.df.apply(lambda row: self.crossover(row.name, 'WT2', 'WT1'), axis=1).fillna(0).astype(int)
-
-    def _get_side(self, row):
-        return 1 if float(row['Close']) > float(row['Short EMA']) > float(row['Long EMA']) else -1 if float(row['Long EMA']) > float(row['Short EMA']) > float(row['Close']) else 0
+        self.df['Long EMA'] = self.cached_indicator('EMA', lambda: talib.EMA(self.df['Close'], timeperiod=self.long_ema_period).astype(float).ffill(), self.long_ema_period)
+        self.df['Short EMA'] = self.cached_indicator('EMA', lambda: talib.EMA(self.df['Close'], timeperiod=self.short_ema_period).astype(float).ffill(), self.short_ema_period)
+        self.df['ATR'] = self.cached_indicator('ATR', lambda: talib.ATR(self.df['High'], self.df['Low'], self.df['Close'], timeperiod=self.atr_period).astype(float).ffill(), self.atr_period)
+        # forward filled, unlike the plain Wavetrend other strategies cache
+        wavetrend_params = (self.wt_channel_lenght, self.wt_average_lenght, self.wt_ma_lenght)
+        self.df['WT1'], self.df['WT2'] = self.cached_indicator('Filled Wavetrend', lambda: (self._set_wavetrend(1).astype(float).ffill(), self._set_wavetrend(2).astype(float).ffill()), *wavetrend_params)
+        self.df['MFI'] = self.cached_indicator('MFI', lambda: self._set_MFI().astype(float).ffill(), self.mfi_period, self.mfi_multiplier, self.mfi_posY)
+
+        self.df['CrossUp'], self.df['CrossDown'] = self.cached_indicator('Filled Wavetrend Cross', self._set_wavetrend_crosses, *wavetrend_params)
+
+    def get_incremental_indicators(self):
+        long_ema = Ema(self.long_ema_period)
+        short_ema = Ema(self.short_ema_period)
+        atr = Atr(self.atr_period)
+        wavetrend = Wavetrend(self.wt_channel_lenght, self.wt_average_lenght, self.wt_ma_lenght)
+        filled_wt1, filled_wt2 = ForwardFill(), ForwardFill()
+        money_flow = MoneyFlow(self.mfi_period, self.mfi_multiplier, self.mfi_posY)
+        filled_mfi = ForwardFill()
+        cross = Cross()
+
+        def update_wavetrend(row):
+            wt1, wt2 = wavetrend.update(row['High'], row['Low'], row['Close'])
+            return filled_wt1.update(wt1), filled_wt2.update(wt2)
+
+        return {
+            'Long EMA': lambda row: long_ema.update(row['Close']),
+            'Short EMA': lambda row: short_ema.update(row['Close']),
+            'ATR': lambda row: atr.update(row['High'], row['Low'], row['Close']),
+            ('WT1', 'WT2'): update_wavetrend,
+            'MFI': lambda row: filled_mfi.update(money_flow.update(row['Open'], row['High'], row['Low'], row['Close'])),
+            ('CrossUp', 'CrossDown'): lambda row: cross.update(row['WT1'], row['WT2'])
+        }
+
+    def set_signals(self):
+        side = self._get_side()
+
+        wt2 = self.df['WT2'].to_numpy()
+        mfi = self.df['MFI'].to_numpy()
+        enter = np.where(side == 1, (self.df['CrossUp'] == 1) & (mfi > 0) & (wt2 < self.zero_line),
+                         (self.df['CrossDown'] == 1) & (mfi < 0) & (wt2 > self.zero_line))
+
+        self.df['Side'] = side
+        self.df['Enter'] = (enter & self.pullbacks(side, self.pullback_period)).astype(int)
+
+    def set_stops(self):
+        close = self.df['Close'].to_numpy()
+        enter = self.df['Enter'].to_numpy() == 1
+        stop_loss = np.where(self.df['Side'] == 1, self.levels['Lower ATR Band'], self.levels['Upper ATR Band'])
+
+        self.df['SL Price'] = np.where(enter, stop_loss, 0.0)
+        self.df['TP Price'] = np.where(enter, close + self.risk_reward * (close - stop_loss), 0.0)
+
+    def _get_side(self):
+        close = self.df['Close'].to_numpy(dtype=float)
+        short_ema = self.df['Short EMA'].to_numpy(dtype=float)
+        long_ema = self.df['Long EMA'].to_numpy(dtype=float)
+
+        return np.select([(close > short_ema) & (short_ema > long_ema), (long_ema > short_ema) & (short_ema > close)], [1, -1], 0).astype(np.int8)
 
     def _enter_trade(self, row):
         if row['Side'] == 1:
@@ -54,17 +104,15 @@ class VumanchuEmasMfi(Strategy):
         prev_index = row.name - 1 if row.name > 0 else 0
 
         # Todo: Look at the charts and use ATR OR Swing High/Low, not both
-        max_values = self.df['High'].rolling(self.swing_lockback_period).max()
-        min_values = self.df['Low'].rolling(self.swing_lockback_period).min()
 
         if bool(self.df['SL Price'].iloc[prev_index]):
             return float(self.df['SL Price'].iloc[prev_index])
         else:
             if row['Enter']:
                 if row['Side'] == 1:
-                    return float(min_values.iloc[row.name] - (float(row['ATR']) * self.atr_multiplier))
+                    return float(self.levels['Lower ATR Band'][row.name])
                 else:
-                    return float(max_values.iloc[row.name] + (float(row['ATR']) * self.atr_multiplier))
+                    return float(self.levels['Upper ATR Band'][row.name])
             else:
                 return 0
 
@@ -82,6 +130,9 @@ class VumanchuEmasMfi(Strategy):
             else:
                 return 0
 
+    def _set_wavetrend_crosses(self):
+        return self.crossovers('WT1', 'WT2').astype(int), self.crossunders('WT1', 'WT2').astype(int)
+
     def _set_wavetrend(self, wtType):
         source = ((self.df['High'] + self.df['Low'] + self.df['Close']) / 3)
         esa = talib.EMA(source, timeperiod=self.wt_channel_lenght)
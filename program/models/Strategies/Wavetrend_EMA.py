@@ -1,6 +1,8 @@
+import numpy as np
 import pandas as pd
 import talib
 
+from program.models.Incremental import Atr, Cross, Ema, Wavetrend
 from program.models.Strategies.Strategy import Strategy
 
 class WavetrendEMA(Strategy):
@@ -22,20 +24,54 @@ class WavetrendEMA(Strategy):
 
         self.swing_lockback_period = 10
 
+        self.vectorized = True
+
     def set_indicators(self):
         self.df = self.df.loc[self.df.notnull().all(axis=1).argmax():]
         self.df.reset_index(inplace=True)
 
-        self.df['EMA'] = talib.EMA(self.df['Close'], timeperiod=self.ema_period).astype(float).ffill()
-        self.df['ATR'] = talib.ATR(self.df['High'], self.df['Low'], self.df['Close'], timeperiod=self.atr_period).astype(float).ffill()
-        self.df['WT1'] = self._set_wavetrend(self.wt_channel_lenght, self.wt_average_lenght, self.wt_ma_lenght, 1)
-        self.df['WT2'] = self._set_wavetrend(self.wt_channel_lenght, self.wt_average_lenght, self.wt_ma_lenght, 2)
+        self.df['EMA'] = self.cached_indicator('EMA', lambda: talib.EMA(self.df['Close'], timeperiod=self.ema_period).astype(float).ffill(), self.ema_period)
+        self.df['ATR'] = self.cached_indicator('ATR', lambda: talib.ATR(self.df['High'], self.df['Low'], self.df['Close'], timeperiod=self.atr_period).astype(float).ffill(), self.atr_period)
+        wavetrend_params = (self.wt_channel_lenght, self.wt_average_lenght, self.wt_ma_lenght)
+        self.df['WT1'], self.df['WT2'] = self.cached_indicator('Wavetrend', lambda: (self._set_wavetrend(*wavetrend_params, 1), self._set_wavetrend(*wavetrend_params, 2)), *wavetrend_params)
+
+        self.df['CrossUp'], self.df['CrossDown'] = self.cached_indicator('Wavetrend Cross', self._set_wavetrend_crosses, *wavetrend_params)
+
+    def get_incremental_indicators(self):
+        ema = Ema(self.ema_period)
+        atr = Atr(self.atr_period)
+        wavetrend = Wavetrend(self.wt_channel_lenght, self.wt_average_lenght, self.wt_ma_lenght)
+        cross = Cross()
+
+        return {
+            'EMA': lambda row: ema.update(row['Close']),
+            'ATR': lambda row: atr.update(row['High'], row['Low'], row['Close']),
+            ('WT1', 'WT2'): lambda row: wavetrend.update(row['High'], row['Low'], row['Close']),
+            ('CrossUp', 'CrossDown'): lambda row: cross.update(row['WT1'], row['WT2'])
+        }
+
+    def set_signals(self):
+        side = self._get_side()
 
-        self.df['CrossUp'] = self.df.apply(lambda row: self.crossover(row.name, 'WT1', 'WT2'), axis=1).fillna(0).astype(int)
-        self.df['CrossDown'] = self.df.apply(lambda row: self.crossover(row.name, 'WT2', 'WT1'), axis=1).fillna(0).astype(int)
+        enter = np.where(side == 1, (self.df['CrossUp'] == 1) & (self.df['WT2'] <= self.wt_oversold),
+                         (self.df['CrossDown'] == 1) & (self.df['WT1'] >= self.wt_overbought))
 
-    def _get_side(self, row):
-        return 1 if float(row['Close']) > float(row['EMA']) else -1 if float(row['EMA']) > float(row['Close']) else 0
+        self.df['Side'] = side
+        self.df['Enter'] = enter.astype(int)
+
+    def set_stops(self):
+        close = self.df['Close'].to_numpy()
+        enter = self.df['Enter'].to_numpy() == 1
+        stop_loss = np.where(self.df['Side'] == 1, self.levels['Lower ATR Band'], self.levels['Upper ATR Band'])
+
+        self.df['SL Price'] = np.where(enter, stop_loss, 0.0)
+        self.df['TP Price'] = np.where(enter, close + self.risk_reward * (close - stop_loss), 0.0)
+
+    def _get_side(self):
+        close = self.df['Close'].to_numpy(dtype=float)
+        ema = self.df['EMA'].to_numpy(dtype=float)
+
+        return np.select([close > ema, ema > close], [1, -1], 0).astype(np.int8)
 
     def _enter_trade(self, row):
         if row['Side'] == 1:
@@ -47,17 +83,15 @@ class WavetrendEMA(Strategy):
         prev_index = row.name - 1 if row.name > 0 else 0
 
         # Todo: Look at the charts and use ATR OR Swing High/Low, not both
-        max_values = self.df['High'].rolling(self.swing_lockback_period).max()
-        min_values = self.df['Low'].rolling(self.swing_lockback_period).min()
 
         if bool(self.df['SL Price'].iloc[prev_index]):
             return float(self.df['SL Price'].iloc[prev_index])
         else:
             if row['Enter']:
                 if row['Side'] == 1:
-                    return float(min_values.iloc[row.name] - (float(row['ATR']) * self.atr_multiplier))
+                    return float(self.levels['Lower ATR Band'][row.name])
                 else:
-                    return float(max_values.iloc[row.name] + (float(row['ATR']) * self.atr_multiplier))
+                    return float(self.levels['Upper ATR Band'][row.name])
             else:
                 return 0
 
@@ -75,6 +109,9 @@ class WavetrendEMA(Strategy):
             else:
                 return 0
 
+    def _set_wavetrend_crosses(self):
+        return self.crossovers('WT1', 'WT2').astype(int), self.crossunders('WT1', 'WT2').astype(int)
+
     def _set_wavetrend(self, channelLenght, avg, MAlenght, wtType):
         source = ((self.df['High'] + self.df['Low'] + self.df['Close']) / 3)
         esa = talib.EMA(source, timeperiod=channelLenght)
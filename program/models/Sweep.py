@@ -0,0 +1,266 @@
+import contextlib
+import io
+import multiprocessing
+import os
+import traceback
+
+import numpy as np
+import pandas as pd
+
+from program.models.Backtest import Backtest
+from program.models.Simulator import simulate_batch_exits
+from program.models.Strategies.Strategy import Strategy
+from program.models.TradeLedger import TradeView
+
+# Sweep of the last (strategy, pair, timeframe) a worker process ran, reused by the following jobs of the same sweep
+_worker_sweeps = {}
+
+
+class Sweep:
+    def __init__(self, strategy_class, symbol, timeframe, starting_balance: float, risk: int, commission=0):
+        super(Sweep, self).__init__()
+
+        self.strategy_class = strategy_class
+        self.symbol = symbol
+        self.tf = timeframe
+        self.starting_balance = starting_balance
+        self.risk = risk
+        self.commission = commission
+
+        self.base_strategy = None
+
+    def prepare(self):
+        # Candle data, indicators and entry signals don't depend on rr or atr, compute them once per pair and timeframe
+        self.base_strategy = self.strategy_class(self.symbol, self.tf)
+        self.base_strategy.set_shared_indicators(signals=self.base_strategy.vectorized)
+
+    def run_backtest(self, rr, atr, test=False, pruning=None, prepared=None):
+        # prepared is the (backtest, simulation) pair simulate_batch returned for this grid point, it is only booked
+        if prepared is not None:
+            backtest, simulation = prepared
+            backtest.run(test, simulation=simulation)
+
+            return backtest
+
+        if self.base_strategy is None:
+            self.prepare()
+
+        backtest = self._get_backtest(rr, atr, pruning)
+        backtest.run(test)
+
+        return backtest
+
+    def simulate_batch(self, parameters, pruning=None):
+        # Trades of every (rr, atr) pair of a vectorized strategy from one pass over the candles. The entries come from
+        # the shared signals, only the stop losses and take profits (and trailing distances) differ between the pairs.
+        # Returns the prepared backtest of every pair with its simulated trades, ready for run_backtest to book.
+        if self.base_strategy is None:
+            self.prepare()
+
+        trailing_stop = self.base_strategy.trailing_stop
+        backtests = []
+        for index, (rr, atr) in enumerate(parameters):
+            backtest = self._get_backtest(rr, atr, pruning)
+            backtest.prepare_vectorized()
+            df = backtest.strategy.df
+
+            if not index:
+                shape = (len(parameters), len(df))
+                stop_losses, take_profits = np.empty(shape), np.empty(shape)
+                distances = np.empty(shape) if trailing_stop else None
+
+            stop_losses[index] = df['SL Price'].to_numpy()
+            take_profits[index] = df['TP Price'].to_numpy()
+            if trailing_stop:
+                distances[index] = df[trailing_stop].to_numpy()
+
+            backtests.append(backtest)
+
+        simulations = simulate_batch_exits(df['Enter'], df['Side'], stop_losses, take_profits, df['High'], df['Low'], distances)
+
+        return list(zip(backtests, simulations))
+
+    def run(self, rrs, atrs, test=False, pruning=None):
+        try:
+            self.prepare()
+        except Exception as e:
+            print('Error preparing {} on Timeframe {}!\n{}'.format(self.symbol, self.tf, e))
+            return []
+
+        parameters = [(rr, atr) for rr in rrs for atr in atrs]
+        prepared = [None] * len(parameters)
+        if self.base_strategy.vectorized and parameters:
+            # if the batch fails every grid point runs on its own and reports its own error
+            try:
+                prepared = self.simulate_batch(parameters, pruning)
+            except Exception:
+                pass
+
+        backtests = []
+        for (rr, atr), grid_point in zip(parameters, prepared):
+            try:
+                backtests.append(self.run_backtest(rr, atr, test, pruning, grid_point))
+            except Exception as e:
+                print('Error Backtesting {} on Timeframe {} with Risk/Reward {} and Atr Multiplier of {}!\n{}'.format(self.symbol, self.tf, rr, atr, e))
+
+        return backtests
+
+    def _get_backtest(self, rr, atr, pruning=None):
+        strategy = self.base_strategy.with_parameters(rr=float(rr), atr_multiplier=float(atr))
+
+        return Backtest(strategy, self.starting_balance, self.risk, commission=self.commission, pruning=pruning)
+
+
+def run_job(job):
+    # Runs one grid point, everything it prints and any error it raises are returned instead of leaking out
+    strategy_class, symbol, tf, rr, atr, starting_balance, risk, commission, test, pruning = job
+
+    def run():
+        return _get_worker_sweep(strategy_class, symbol, tf, starting_balance, risk, commission).run_backtest(rr, atr, test, pruning)
+
+    return _run_grid_point(strategy_class, symbol, tf, rr, atr, run)
+
+
+def run_batch_job(job):
+    # Runs every grid point of one pair and timeframe, a vectorized strategy simulates them in one pass over the candles.
+    # If the batch simulation fails every grid point runs on its own, so each one reports its own result or error.
+    strategy_class, symbol, tf, rrs, atrs, starting_balance, risk, commission, test, pruning = job
+    parameters = [(rr, atr) for rr in rrs for atr in atrs]
+    prepared = [None] * len(parameters)
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            sweep = _get_worker_sweep(strategy_class, symbol, tf, starting_balance, risk, commission)
+            if sweep.base_strategy is None:
+                sweep.prepare()
+            if sweep.base_strategy.vectorized and parameters:
+                prepared = sweep.simulate_batch(parameters, pruning)
+    except Exception:
+        pass
+
+    def run(rr, atr, grid_point):
+        return _get_worker_sweep(strategy_class, symbol, tf, starting_balance, risk, commission).run_backtest(rr, atr, test, pruning, grid_point)
+
+    return [_run_grid_point(strategy_class, symbol, tf, rr, atr, lambda: run(rr, atr, grid_point)) for (rr, atr), grid_point in zip(parameters, prepared)]
+
+
+def _get_worker_sweep(strategy_class, symbol, tf, starting_balance, risk, commission):
+    key = (strategy_class, symbol, tf, starting_balance, risk, commission)
+    if key not in _worker_sweeps:
+        _worker_sweeps.clear()
+        _worker_sweeps[key] = Sweep(strategy_class, symbol, tf, starting_balance, risk, commission=commission)
+
+    return _worker_sweeps[key]
+
+
+def _run_grid_point(strategy_class, symbol, tf, rr, atr, run):
+    result = {
+        'strategy': strategy_class.__name__,
+        'pair': symbol,
+        'tf': tf,
+        'rr': rr,
+        'atr': atr,
+        'status': 'ok',
+        'error': None,
+        'traceback': None,
+        'pruned': None,
+        'balance': None,
+        'trades': None,
+        'results': {},
+        'underwater': None,
+        'indicator_cache': {}
+    }
+
+    cache_stats = Strategy.indicator_cache.stats()
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output):
+            backtest = run()
+
+        if backtest.pruned:
+            result['status'] = 'pruned'
+            result['pruned'] = backtest.pruned
+
+        result['balance'] = backtest.balance
+        result['trades'] = len(backtest.trades)
+        result['results'] = {name: value for name, value in backtest.results.items() if not isinstance(value, (list, TradeView))}
+        result['underwater'] = backtest.underwater
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = str(e)
+        result['traceback'] = traceback.format_exc()
+
+    result['log'] = output.getvalue()
+    result['indicator_cache'] = {name: value - cache_stats[name] for name, value in Strategy.indicator_cache.stats().items()}
+
+    return result
+
+
+def run_sweeps(strategy_class, pairs, tfs, rrs, atrs, starting_balance: float, risk: int, commission=0, processes=1, test=False, pruning=None, batch=False):
+    # Results come back in job order whatever the number of processes, so the output of a parallel run matches a serial one.
+    # With batch every job is the whole rr x atr grid of one pair and timeframe, simulated in one pass for vectorized strategies.
+    processes = processes or os.cpu_count()
+    if batch:
+        jobs = [(strategy_class, pair, tf, rrs, atrs, starting_balance, risk, commission, test, pruning) for tf in tfs for pair in pairs]
+        job_runner, chunksize = run_batch_job, 1
+    else:
+        jobs = [(strategy_class, pair, tf, rr, atr, starting_balance, risk, commission, test, pruning) for tf in tfs for pair in pairs for rr in rrs for atr in atrs]
+        # keep consecutive grid points of one pair and timeframe together so workers can reuse their indicators
+        grid_size = max(1, len(rrs) * len(atrs))
+        job_runner, chunksize = run_job, max(1, min(grid_size, -(-len(jobs) // processes)))
+
+    if processes == 1:
+        return _collect_results(map(job_runner, jobs))
+
+    with multiprocessing.Pool(processes, initializer=_init_worker) as pool:
+        return _collect_results(pool.imap(job_runner, jobs, chunksize=chunksize))
+
+
+def get_indicator_cache_stats(results):
+    # Indicator cache hits, misses and evictions summed over the jobs of a sweep, whichever process ran them
+    totals = {'hits': 0, 'misses': 0, 'evictions': 0}
+    for result in results:
+        for name, value in result['indicator_cache'].items():
+            totals[name] += value
+
+    return totals
+
+
+def get_pruned_jobs(results):
+    # Why each pruned job stopped, keyed by (pair, tf, rr, atr)
+    return {(result['pair'], result['tf'], result['rr'], result['atr']): result['pruned'] for result in results if result['status'] == 'pruned'}
+
+
+def get_underwater_curves(results):
+    # Underwater curves of the jobs that got to their results, one column per (pair, tf, rr, atr), aligned on candle time
+    curves = {(result['pair'], result['tf'], result['rr'], result['atr']): result['underwater'] for result in results if result['underwater'] is not None}
+    if not curves:
+        return pd.DataFrame()
+
+    return pd.concat(curves, axis=1, names=['pair', 'tf', 'rr', 'atr'])
+
+
+def _init_worker():
+    # workers share one memory mapped copy of every candle series instead of each parsing its own
+    Strategy.shared_candles = True
+
+
+def _collect_results(results):
+    collected = []
+    for result in _flatten(results):
+        print(result['log'], end='')
+        if result['status'] == 'error':
+            print('Error Backtesting {} on Timeframe {} with Risk/Reward {} and Atr Multiplier of {}!\n{}'.format(result['pair'], result['tf'], result['rr'], result['atr'], result['error']))
+
+        collected.append(result)
+
+    return collected
+
+
+def _flatten(results):
+    # batch jobs return the results of their grid points as a list
+    for result in results:
+        if isinstance(result, list):
+            yield from result
+        else:
+            yield result
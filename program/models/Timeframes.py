@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+
+from program.models.Kernels import repeated_ema
+
+# Binance candles of a week open on monday, the unix epoch is a thursday
+_week = pd.Timedelta('7D').value
+_monday = pd.Timestamp('1970-01-05').value
+
+
+def get_timedelta(tf):
+    # Length of a timeframe, both in the Binance ('15m', '4h', '1d', '1w') and the pandas ('15T', '60T') notation.
+    # Months ('1M') don't have a fixed length.
+    if tf.endswith('M'):
+        raise ValueError('Timeframe {} has no fixed length'.format(tf))
+
+    if tf.endswith('T'):
+        return pd.Timedelta(minutes=int(tf[:-1]))
+
+    return pd.Timedelta(tf.replace('m', 'min') if tf.endswith('m') else tf)
+
+
+def get_origin(step):
+    # Time in nanoseconds the candles of a timeframe of step nanoseconds are counted from
+    return _monday if step % _week == 0 else 0
+
+
+def resample_candles(df, tf):
+    # OHLCV candles of tf aggregated from the candles in df, every candle goes to the tf bin its open time falls in.
+    # Last Open Time is the open time of the last candle in the bin, the first candle of df the bin is complete at.
+    times = df['Open Time'].to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    step = get_timedelta(tf).value
+    origin = get_origin(step)
+    bins = (times - origin) // step
+
+    starts = np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]])
+    ends = np.r_[starts[1:], len(bins)] - 1
+
+    return pd.DataFrame({
+        'Open Time': pd.to_datetime(bins[starts] * step + origin),
+        'Open': df['Open'].to_numpy(dtype=float)[starts],
+        'High': np.maximum.reduceat(df['High'].to_numpy(dtype=float), starts),
+        'Low': np.minimum.reduceat(df['Low'].to_numpy(dtype=float), starts),
+        'Close': df['Close'].to_numpy(dtype=float)[ends],
+        'Volume': np.add.reduceat(df['Volume'].to_numpy(dtype=float), starts),
+        'Close Time': df['Close Time'].to_numpy()[ends],
+        'Last Open Time': df['Open Time'].to_numpy()[ends]
+    })
+
+
+def align(candles, values, open_times):
+    # As-of join of values (one per candle of a higher timeframe) onto the candles opening at open_times: every candle
+    # gets the value of the last higher timeframe candle that is complete by then, NaN before the first one.
+    # Only candles that already closed went into that value, so the higher timeframe never looks ahead.
+    position = np.searchsorted(candles['Last Open Time'].to_numpy(dtype='datetime64[ns]'), np.asarray(open_times, dtype='datetime64[ns]'), side='right') - 1
+    values = np.asarray(values, dtype=float)
+
+    return np.where(position >= 0, values[np.maximum(position, 0)], np.nan)
+
+
+def stepped_ema(close, open_times, tf, period):
+    # EMA of the close sampled every tf, for a tf shorter than the candles: a close counts once for every tf step
+    # until the next candle opens, like a forward filled resample to tf, without building the resampled series.
+    times = np.asarray(open_times, dtype='datetime64[ns]').astype(np.int64)
+    step = get_timedelta(tf).value
+    steps = -((times[0] - times) // step)
+    repeats = np.diff(np.r_[steps, steps[-1] + 1]) if len(steps) else steps
+
+    return repeated_ema(close, repeats, period)
+
+
+class TimeframeService:
+    # Candles of higher timeframes derived from the candles of a strategy, cached per (symbol, base tf, target tf).
+    # A cached frame is rebuilt when the base candles it came from don't span the same candles anymore.
+    def __init__(self):
+        super(TimeframeService, self).__init__()
+
+        self.frames = {}
+
+    def get_candles(self, symbol, base_tf, df, tf):
+        times = df['Open Time'].to_numpy()
+        stamp = (len(times), times[0], times[-1]) if len(times) else (0,)
+        key = (symbol, base_tf, tf)
+
+        cached = self.frames.get(key)
+        if cached is None or cached[0] != stamp:
+            cached = (stamp, resample_candles(df, tf))
+            self.frames[key] = cached
+
+        return cached[1]
+
+    def get_indicator(self, symbol, base_tf, df, tf, compute):
+        # compute(candles) of the tf candles, aligned back onto the candles of df
+        candles = self.get_candles(symbol, base_tf, df, tf)
+
+        return align(candles, compute(candles), df['Open Time'])
+
+    def clear(self):
+        self.frames.clear()
@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+
+
+class TradeLedger:
+    # side and outcome codes of the ledger, the trade dicts keep the 'Long'/'Short' and '+'/'-'/'0' strings
+    LONG = 1
+    SHORT = -1
+
+    WIN = 1
+    LOSS = -1
+    BREAK_EVEN = 0
+    OPEN = 2
+
+    dtype = np.dtype([
+        ('open_time', 'M8[ns]'),
+        ('close_time', 'M8[ns]'),
+        ('side', np.int8),
+        ('outcome', np.int8),
+        ('price', np.float64),
+        ('take_profit', np.float64),
+        ('stop_loss', np.float64),
+        ('size', np.float64),
+        ('return', np.float64),
+        ('return_perc', np.float64),
+        ('close_price', np.float64),
+        ('balance', np.float64)
+    ])
+
+    outcome_names = {WIN: '+', LOSS: '-', BREAK_EVEN: '0'}
+
+    def __init__(self, capacity=64):
+        super(TradeLedger, self).__init__()
+
+        self._records = np.zeros(capacity, dtype=self.dtype)
+        self._length = 0
+
+    @classmethod
+    def from_records(cls, records):
+        # Ledger holding a copy of already booked trades
+        ledger = cls(capacity=max(len(records), 1))
+        ledger._records[:len(records)] = records
+        ledger._length = len(records)
+
+        return ledger
+
+    def open(self, open_time, side, price, take_profit, stop_loss, size):
+        if self._length == len(self._records):
+            # geometric growth keeps appending amortized O(1)
+            records = np.zeros(2 * len(self._records), dtype=self.dtype)
+            records[:self._length] = self._records
+            self._records = records
+
+        self._records[self._length] = (pd.Timestamp(open_time).to_datetime64(), np.datetime64('NaT'), side, self.OPEN, price, take_profit, stop_loss, size, 0.0, 0.0, 0.0, 0.0)
+        self._length += 1
+
+    def close(self, close_time, close_price, return_amount, return_perc, outcome, balance):
+        index = self._length - 1
+        self._records['close_time'][index] = pd.Timestamp(close_time).to_datetime64()
+        self._records['close_price'][index] = close_price
+        self._records['return'][index] = return_amount
+        self._records['return_perc'][index] = return_perc
+        self._records['outcome'][index] = outcome
+        self._records['balance'][index] = balance
+
+    def pop(self):
+        # only the last trade can still be open, the backtest drops it when the data ends
+        self._length -= 1
+
+        return self._to_dict(self._records[self._length])
+
+    @property
+    def records(self):
+        # view of the booked trades, no copy
+        return self._records[:self._length]
+
+    def mask(self, side=None, outcome=None):
+        records = self.records
+        mask = np.ones(len(records), dtype=bool)
+        if side is not None:
+            mask &= records['side'] == side
+        if outcome is not None:
+            mask &= records['outcome'] == outcome
+
+        return mask
+
+    def view(self, side=None, outcome=None):
+        return TradeView(self, self.mask(side, outcome))
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        return self._to_dict(self.records[index])
+
+    def __iter__(self):
+        for index in range(self._length):
+            yield self._to_dict(self._records[index])
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def _to_dict(self, record):
+        # the trade as the dict the list based ledger used to hold
+        trade = {
+            'Open Time': pd.Timestamp(record['open_time']),
+            'Side': 'Long' if record['side'] == self.LONG else 'Short',
+            'Price': float(record['price']),
+            'Take Profit': float(record['take_profit']),
+            'Stop Loss': float(record['stop_loss']),
+            'Size': float(record['size'])
+        }
+
+        if record['outcome'] != self.OPEN:
+            trade['Return'] = float(record['return'])
+            trade['Return Perc'] = float(record['return_perc'])
+            trade['Outcome'] = self.outcome_names[int(record['outcome'])]
+            trade['Close Price'] = float(record['close_price'])
+            trade['Close Time'] = pd.Timestamp(record['close_time'])
+            trade['Balance'] = float(record['balance'])
+
+        return trade
+
+
+class TradeView:
+    # Subset of a ledger selected by a boolean mask, trades are only turned into dicts when iterated
+    def __init__(self, ledger, mask):
+        super(TradeView, self).__init__()
+
+        self.ledger = ledger
+        self.mask = mask
+
+    def __len__(self):
+        return int(np.count_nonzero(self.mask))
+
+    def __iter__(self):
+        for index in np.flatnonzero(self.mask):
+            yield self.ledger[index]
+
+    def __eq__(self, other):
+        return list(self) == list(other)